@@ -0,0 +1,388 @@
+import argparse
+import importlib
+import itertools
+import math
+import os
+import time
+from multiprocessing import get_context
+
+import numpy as np
+
+from candles import CandleStore
+from orders import place_order
+from portfolio import Portfolio
+from recorder import Replay
+from simulator import CHUNK, TIMEFRAMES, MarketSimulator, TickBatch, make_symbols
+
+YEAR = 365 * 86400
+FILL = np.dtype([('t', 'f8'), ('sym', 'i4'), ('qty', 'i8'), ('price', 'f8'), ('realized', 'f8')])
+
+
+class Strategy:
+    """Base class for automated strategies; override whichever callbacks you need.
+
+    Parameters are declared in the `params` class dict with their defaults and
+    become attributes. Callbacks get a Context for reading the market and
+    placing orders. Only the candle timeframes listed in `timeframes` are
+    kept during a backtest, so a strategy that trades one timeframe should
+    say so. on_tick receives each TickBatch (all symbols, one or more
+    steps), on_bar the bar that just completed at a timeframe as {field:
+    array over symbols}, on_fill each of the strategy's fills and
+    on_margin_call the simulator's liquidation.
+    """
+
+    params = {}
+    timeframes = TIMEFRAMES
+
+    def __init__(self, **params):
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise ValueError(f"Unknown parameters {', '.join(sorted(unknown))}")
+        for k, v in {**self.params, **params}.items():
+            setattr(self, k, v)
+
+    def on_start(self, ctx):
+        pass
+
+    def on_tick(self, ctx, batch):
+        pass
+
+    def on_bar(self, ctx, tf, bar):
+        pass
+
+    def on_fill(self, ctx, fill):
+        pass
+
+    def on_margin_call(self, ctx, call):
+        pass
+
+
+class Context:
+    """What a strategy sees: the market, its account, and order entry through orders.place_order."""
+
+    def __init__(self, sim, portfolio):
+        self.sim = sim
+        self.portfolio = portfolio
+        self.symbols = sim.symbols
+        self.index = sim.index
+        self.working = set()
+        self.rejected = 0
+
+    @property
+    def time(self):
+        return self.sim.clock
+
+    @property
+    def price(self):
+        return self.sim.price
+
+    @property
+    def bid(self):
+        return self.sim.bid
+
+    @property
+    def ask(self):
+        return self.sim.ask
+
+    def position(self, sym):
+        return self.portfolio.position(sym)[0]
+
+    def order(self, sym, side, qty, typ="MARKET", price=None):
+        """Place an order; returns the Execution, or None when the account can't take it."""
+        try:
+            ex = place_order(self.sim, self.portfolio, sym, side, int(qty), typ, price)
+        except ValueError:
+            self.rejected += 1
+            return None
+        if ex.resting is not None:
+            self.working.add(sym)
+        return ex
+
+    def buy(self, sym, qty, price=None):
+        return self.order(sym, 'buy', qty, "MARKET" if price is None else "LIMIT", price)
+
+    def sell(self, sym, qty, price=None):
+        return self.order(sym, 'sell', qty, "MARKET" if price is None else "LIMIT", price)
+
+    def target(self, sym, qty):
+        """Trade at market towards a position of qty (negative for short)."""
+        d = int(qty) - self.position(sym)
+        if d:
+            return self.order(sym, 'buy' if d > 0 else 'sell', abs(d))
+        return None
+
+    def close(self, sym):
+        size = self.position(sym)
+        if size:
+            # closing never needs margin, so it bypasses the account check
+            return self.sim.submit(sym, 'sell' if size > 0 else 'buy', abs(size))
+        return None
+
+    def close_all(self):
+        for sym in list(self.portfolio.positions()):
+            self.close(sym)
+
+    def cancel_all(self, sym):
+        self.working.discard(sym)
+        return self.sim.cancel_all(sym)
+
+    def history(self, sym, tf, n=None):
+        return self.sim.get_history(sym, tf, n)
+
+    def study(self, sym, tf, spec, n=None):
+        return self.sim.get_study(sym, tf, spec, n)
+
+    def values(self, tf, spec):
+        """An indicator's current values for every symbol, as {output: array over symbols}."""
+        return {k: v[-1] for k, v in self.sim.candles.study_frame(tf, spec, 1).items()}
+
+
+class _Ledger(Portfolio):
+    """Portfolio that also logs every fill with its realized P&L."""
+
+    def __init__(self, sim, *args, **kw):
+        super().__init__(*args, **kw)
+        self.sim = sim
+        self.log = []
+
+    def fill(self, sym, qty, price):
+        realized = super().fill(sym, qty, price)
+        self.log.append((self.sim.clock, self.index[sym], qty, price, realized))
+        return realized
+
+
+class Tape:
+    """A session cut into TickBatches that never straddle a base bar.
+
+    closes[j] lists the timeframes whose bar is complete once piece j has
+    been applied, so strategies see each bar before the first tick of the
+    next one, with no look-ahead.
+    """
+
+    def __init__(self, symbols, price, bid, ask, clock, batches, timeframes=TIMEFRAMES):
+        self.symbols = list(symbols)
+        self.price, self.bid, self.ask, self.clock = price, bid, ask, clock
+        self.timeframes = sorted(timeframes)
+        base = self.timeframes[0]
+        self.pieces = []
+        for b in batches:
+            bucket = b.times.astype(np.int64) // base
+            cuts = np.flatnonzero(bucket[1:] != bucket[:-1]) + 1
+            for lo, hi in zip(np.r_[0, cuts], np.r_[cuts, len(bucket)]):
+                self.pieces.append(TickBatch(b.times[lo:hi], b.idx, *(a[lo:hi] for a in b[2:])))
+        self.closes = []
+        for j, p in enumerate(self.pieces):
+            t = int(p.times[-1])
+            nxt = int(self.pieces[j + 1].times[0]) if j + 1 < len(self.pieces) else None
+            self.closes.append(tuple(tf for tf in self.timeframes if nxt is None or nxt // tf != t // tf))
+        self.bar_times = np.array([p.times[-1] for p, c in zip(self.pieces, self.closes) if c], dtype=float)
+        self.bars = len(self.bar_times)
+        self.ticks = sum(p.price.size for p in self.pieces)
+
+    @classmethod
+    def simulate(cls, symbols=10, steps=20000, seed=1):
+        """A seeded max-speed session of `symbols` symbols over `steps` steps."""
+        sim = MarketSimulator(make_symbols(symbols), seed=seed, candles=False)
+        start = (sim.price.copy(), sim.bid.copy(), sim.ask.copy(), sim.clock)
+        batches = [sim.step(min(CHUNK, steps - k)) for k in range(0, steps, CHUNK)]
+        return cls(sim.symbols, *start, batches)
+
+    @classmethod
+    def replay(cls, path):
+        """A recorded session; each symbol starts from its first recorded quote."""
+        r = Replay(path)
+        sim = MarketSimulator(r.symbols, candles=False)
+        r.prime(sim)
+        return cls(r.symbols, sim.price, sim.bid, sim.ask, sim.clock, [b for _, b in r.batches()])
+
+
+def run(strategy, tape, cash=10000.0, leverage=1000, seed=0):
+    """Run one strategy over a tape; returns the equity curve sampled at each base bar, fills and stats.
+
+    The market follows the tape, while order books, fills, P&L and margin
+    (including liquidation on a margin call) go through the same
+    MarketSimulator and Portfolio code as the terminal.
+    """
+    sim = MarketSimulator(tape.symbols, seed=seed)
+    tfs = sorted(set(strategy.timeframes))
+    if tfs != sorted(sim.candles.timeframes):
+        sim.candles = CandleStore(tape.symbols, sim.price, tfs, sim.candles.frames[sim.candles.base].capacity)
+    bus = sim.bus.subscribe("backtest", policy='drop_oldest')
+    p = _Ledger(sim, tape.symbols, cash=cash, leverage=leverage)
+    sim.attach(p)
+    sim.reset_prices(tape.price, tape.bid, tape.ask, tape.clock)
+    ctx = Context(sim, p)
+    base = tape.timeframes[0]
+    equity = np.empty(tape.bars)
+    margin_calls = 0
+    k = 0
+
+    def dispatch():
+        nonlocal margin_calls
+        for ev in bus.drain():
+            if ev.kind == 'fill':
+                strategy.on_fill(ctx, ev)
+            elif ev.kind == 'margin_call':
+                margin_calls += 1
+                strategy.on_margin_call(ctx, ev)
+
+    strategy.on_start(ctx)
+    for piece, closes in zip(tape.pieces, tape.closes):
+        sim.apply(piece)
+        # keep books with resting strategy orders quoting, so those can fill
+        for sym in list(ctx.working):
+            b = sim.book(sym)
+            if not any(o.owner == 'user' for o in b.orders.values()):
+                ctx.working.discard(sym)
+        dispatch()
+        strategy.on_tick(ctx, piece)
+        for tf in closes:
+            if tf not in sim.candles.frames:
+                continue
+            bar = {name: v[-1] for name, v in sim.candles.frame(tf, 1).items()}
+            strategy.on_bar(ctx, tf, bar)
+        dispatch()
+        if closes:
+            equity[k] = p.equity
+            k += 1
+    fills = np.array(p.log, dtype=FILL)
+    return {'time': tape.bar_times, 'equity': equity, 'fills': fills,
+            'stats': stats(equity, fills, cash, base, margin_calls, ctx.rejected)}
+
+
+def stats(equity, fills, cash, bar_seconds, margin_calls=0, rejected=0):
+    """Performance and trade statistics from an equity curve and a fill log."""
+    out = {'final_equity': float(equity[-1]) if len(equity) else cash,
+           'return': float(equity[-1] / cash - 1) if len(equity) else 0.0}
+    if len(equity):
+        peak = np.maximum.accumulate(np.r_[cash, equity])[1:]
+        out['max_drawdown'] = float((equity / peak - 1).min())
+        prev = np.r_[cash, equity[:-1]]
+        r = np.divide(equity - prev, prev, out=np.zeros(len(equity)), where=prev > 0)
+        sd = r.std()
+        out['sharpe'] = float(r.mean() / sd * math.sqrt(YEAR / bar_seconds)) if sd > 0 else 0.0
+    else:
+        out['max_drawdown'] = out['sharpe'] = 0.0
+    closing = fills['realized'][fills['realized'] != 0]
+    wins, losses = closing[closing > 0], closing[closing < 0]
+    out.update(fills=len(fills), trades=len(closing), realized=float(closing.sum()),
+               win_rate=len(wins) / len(closing) if len(closing) else 0.0,
+               avg_win=float(wins.mean()) if len(wins) else 0.0,
+               avg_loss=float(losses.mean()) if len(losses) else 0.0,
+               profit_factor=float(wins.sum() / -losses.sum()) if len(losses) else math.inf if len(wins) else 0.0,
+               margin_calls=margin_calls, rejected=rejected)
+    return out
+
+
+_TAPES = {}
+
+
+def load_tape(source):
+    """Tape for ('seed', symbols, steps, seed) or ('replay', path), built once per process."""
+    tape = _TAPES.get(source)
+    if tape is None:
+        tape = _TAPES[source] = Tape.simulate(*source[1:]) if source[0] == 'seed' else Tape.replay(source[1])
+    return tape
+
+
+def _run_variant(job):
+    cls, params, source, kw = job
+    r = run(cls(**params), load_tape(source), **kw)
+    return r['stats'], r['equity']
+
+
+def grid(cls, space, source=('seed', 10, 20000, 1), processes=None, **kw):
+    """Run cls over every combination in space ({param: [values]}) across a process pool.
+
+    Every variant sees the same tape, so the equity curves come back stacked
+    as one (variants, bars) array next to a per-variant stats list.
+    """
+    names = list(space)
+    variants = [dict(zip(names, combo)) for combo in itertools.product(*(space[n] for n in names))]
+    tape = load_tape(source)
+    jobs = [(cls, v, source, kw) for v in variants]
+    t0 = time.perf_counter()
+    if processes == 1:
+        results = list(map(_run_variant, jobs))
+    else:
+        with get_context("spawn").Pool(processes) as pool:
+            chunk = max(1, len(jobs) // ((processes or os.cpu_count()) * 4))
+            results = pool.map(_run_variant, jobs, chunksize=chunk)
+    elapsed = time.perf_counter() - t0
+    return {'params': variants, 'stats': [s for s, _ in results],
+            'equity': np.array([e for _, e in results]).reshape(len(variants), tape.bars),
+            'time': tape.bar_times, 'elapsed': elapsed,
+            'variants_per_min': len(variants) / elapsed * 60 if elapsed else 0.0}
+
+
+class MovingAverageCross(Strategy):
+    """Long every symbol whose fast EMA is above its slow EMA, short the rest, about `notional` each."""
+
+    params = {'fast': 10, 'slow': 30, 'tf': 5, 'notional': 2000.0}
+
+    @property
+    def timeframes(self):
+        return (self.tf,)
+
+    def on_start(self, ctx):
+        self.specs = (f"ema{self.fast}", f"ema{self.slow}")
+        self.seen = 0
+
+    def on_bar(self, ctx, tf, bar):
+        if tf != self.tf:
+            return
+        self.seen += 1
+        fast, slow = (ctx.values(tf, s)['value'] for s in self.specs)
+        if self.seen < self.slow:
+            return
+        price = np.maximum(bar['close'], 0.01)
+        want = (np.sign(fast - slow) * np.floor(self.notional / price)).astype(np.int64)
+        for i in np.flatnonzero(want != ctx.portfolio.size):
+            ctx.target(ctx.symbols[i], want[i])
+
+
+def _value(s):
+    for cast in (int, float):
+        try:
+            return cast(s)
+        except ValueError:
+            pass
+    return s
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Headless strategy backtests and parameter sweeps")
+    ap.add_argument("--strategy", default="backtest:MovingAverageCross", help="module:Class")
+    ap.add_argument("--grid", nargs="*", default=[], metavar="NAME=V1,V2",
+                    help="parameter values to sweep, e.g. fast=5,10,20 slow=30,60")
+    ap.add_argument("--replay", metavar="PATH", help="backtest over a recording instead of a seeded session")
+    ap.add_argument("--symbols", type=int, default=10)
+    ap.add_argument("--steps", type=int, default=20000)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--cash", type=float, default=10000.0)
+    ap.add_argument("--procs", type=int, default=None, help="worker processes (default: one per CPU)")
+    ap.add_argument("--top", type=int, default=10)
+    args = ap.parse_args(argv)
+
+    module, name = args.strategy.split(":")
+    cls = getattr(importlib.import_module(module), name)
+    space = {}
+    for item in args.grid:
+        k, vals = item.split("=", 1)
+        space[k] = [_value(v) for v in vals.split(",")]
+    source = ('replay', args.replay) if args.replay else ('seed', args.symbols, args.steps, args.seed)
+    tape = load_tape(source)
+    print(f"{len(tape.symbols)} symbols, {tape.ticks:,} ticks, {tape.bars:,} bars, {len(tape.pieces):,} pieces")
+    res = grid(cls, space, source, args.procs, cash=args.cash)
+    n = len(res['params'])
+    print(f"{n:,} variants in {res['elapsed']:.2f}s ({res['variants_per_min']:,.0f} variants/min)")
+    order = sorted(range(n), key=lambda j: -res['stats'][j]['sharpe'])
+    for j in order[:args.top]:
+        s = res['stats'][j]
+        print(f"  {res['params'][j]}  return {s['return']:+8.2%}  sharpe {s['sharpe']:7.2f}  "
+              f"max dd {s['max_drawdown']:7.2%}  trades {s['trades']:5d}  win {s['win_rate']:5.1%}  "
+              f"margin calls {s['margin_calls']}")
+
+
+if __name__ == "__main__":
+    main()
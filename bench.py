@@ -0,0 +1,350 @@
+import argparse
+import cProfile
+import gc
+import json
+import os
+import platform
+import pstats
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from multiprocessing import get_context
+
+import matplotlib
+import numpy as np
+
+matplotlib.use("Agg")
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from candles import CandleStore
+from chart import CandleChart
+from eventbus import Dom, EventBus, Tick, Trade
+from grid import TreeGrid, VirtualList, dom_rows, position_rows
+from portfolio import Portfolio
+from simulator import MarketSimulator, make_symbols
+
+FPS = 30
+# module groups timed in a fresh interpreter each; core is what --headless needs
+IMPORTS = {'core': "simulator, orderbook, portfolio, orders", 'session': "session", 'gateway': "gateway",
+           'chart': "chart", 'tk_backend': "matplotlib.backends.backend_tkagg"}
+FIRST_TICK = ("import time; t = time.perf_counter(); from session import Session; "
+              "s = Session(started=t).start(); s.wait_first_tick(10); import json; print(json.dumps(s.startup))")
+DOM_COLUMNS = ("Price", "Size", "Total")
+POS_COLUMNS = ("Symbol", "Size", "Avg Price", "Unreal P&L", "Close")
+
+
+class _NullTree:
+    """Accepts the calls TreeGrid makes when there is no display to build a ttk.Treeview on."""
+
+    def __init__(self):
+        self.n = 0
+
+    def insert(self, parent, index, values=(), tags=()):
+        self.n += 1
+        return f"I{self.n}"
+
+    def set(self, iid, column, value):
+        pass
+
+    def item(self, iid, **kw):
+        pass
+
+    def delete(self, *iids):
+        pass
+
+
+class _NullListbox:
+    def insert(self, index, *items):
+        pass
+
+    def delete(self, first, last=None):
+        pass
+
+    def itemconfig(self, index, **kw):
+        pass
+
+    def bind(self, *args):
+        pass
+
+
+def _widgets():
+    """Real (withdrawn) Tk widgets when a display is available, otherwise null stand-ins."""
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        root = tk.Tk()
+    except Exception:
+        return "null", _NullTree(), _NullTree(), _NullListbox()
+    root.withdraw()
+    return ("tk", ttk.Treeview(root, columns=DOM_COLUMNS), ttk.Treeview(root, columns=POS_COLUMNS),
+            tk.Listbox(root))
+
+
+class Stage:
+    """Per-call wall time for one benchmark stage, in nanoseconds."""
+
+    def __init__(self, name, ticks_per_call=0):
+        self.name = name
+        self.ticks_per_call = ticks_per_call
+        self.samples = []
+
+    def time(self, fn, *args):
+        t0 = time.perf_counter_ns()
+        out = fn(*args)
+        self.samples.append(time.perf_counter_ns() - t0)
+        return out
+
+    def result(self):
+        s = np.array(self.samples) / 1000.0
+        out = {'calls': len(s), 'mean_us': float(s.mean()), 'p50_us': float(np.percentile(s, 50)),
+               'p99_us': float(np.percentile(s, 99)), 'max_us': float(s.max())}
+        if self.ticks_per_call:
+            out['ticks_per_call'] = self.ticks_per_call
+            out['ticks_per_s'] = self.ticks_per_call * len(s) / (s.sum() / 1e6)
+        return out
+
+
+def _allocations(fn, calls, ticks_per_call, setup=None):
+    """Transient bytes allocated per call (tracemalloc peak) and live blocks left behind per tick."""
+    gc.collect()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    peak = 0
+    for _ in range(calls):
+        if setup is not None:
+            setup()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        peak += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    gc.collect()
+    per = ticks_per_call or 1
+    return {'alloc_bytes_per_tick': peak / calls / per,
+            'net_blocks_per_tick': (sys.getallocatedblocks() - blocks) / (calls * per) if setup is None else None}
+
+
+def run_config(symbols, rate, calls, batch, seed):
+    """Every stage at one symbol count and tick rate; returns {stage: stats}, plus peak RSS."""
+    syms = make_symbols(symbols)
+    rng = np.random.default_rng(seed)
+    stages = {}
+    allocs = {}
+
+    def bench(name, fn, ticks=0, setup=None, n=calls):
+        st = Stage(name, ticks)
+        for _ in range(n):
+            if setup is not None:
+                setup()
+            st.time(fn)
+        stages[name] = st.result()
+        allocs[name] = _allocations(fn, max(1, n // 10), ticks, setup)
+
+    # simulator: a batch over the whole universe, and one wall-clock tick as MarketSimulator.run does it
+    sim = MarketSimulator(syms, seed=seed)
+    bench("sim.step", lambda: sim.step(batch), ticks=symbols * batch)
+    sym = syms[0]
+    i = sim.index[sym]
+
+    def run_tick():
+        b = sim.step(1, idx=[i], now=time.time())
+        sim.book(sym)
+        sim.publish_batch(b)
+    bench("sim.run_tick", run_tick, ticks=1)
+
+    raw = MarketSimulator(syms, seed=seed, candles=False)
+    batches = [raw.step(batch) for _ in range(min(calls, 64))]
+    store = CandleStore(syms, raw.price)
+    it = iter(range(10**9))
+    bench("candles.ingest", lambda: store.ingest(batches[next(it) % len(batches)]), ticks=symbols * batch)
+    studied = CandleStore(syms, raw.price)
+    for tf in studied.timeframes:
+        for spec in ("sma20", "ema20", "bb20", "rsi14", "atr14", "vwap"):
+            studied.add(tf, spec)
+    bench("candles.studies", lambda: studied.ingest(batches[next(it) % len(batches)]), ticks=symbols * batch)
+    bench("study.read", lambda: studied.study(sym, 60, "bb20"))
+
+    # order book and matching
+    move = lambda: sim.step(1, idx=[i])
+    bench("book.refresh", lambda: sim.book(sym), setup=move)
+    book = sim.book(sym)
+    bench("book.depth", lambda: book.depth(15), setup=lambda: (move(), sim.book(sym)))
+    sides = iter(range(10**9))
+    bench("matching.submit", lambda: sim.submit(sym, 'buy' if next(sides) % 2 else 'sell', 1, owner='bench'))
+
+    # event bus: one UI frame's worth of events at `rate` ticks/s, published and drained
+    bus = EventBus()
+    feed = bus.subscribe("ui", capacity=2048, policy="conflate")
+    per_frame = max(1, int(rate // FPS))
+
+    def frame_events():
+        picks = rng.integers(symbols, size=per_frame).tolist()
+        for j in picks:
+            s = syms[j]
+            bus.publish([Trade(s, 'buy', 100, 1.0, "00:00:00.000"), Tick(s, 1.0, 0.99, 1.01, 0.0), Dom(s)])
+    bench("bus.frame", lambda: feed.drain(), ticks=per_frame, setup=frame_events)
+
+    # chart: intrabar ticks blit, a new bar or a new view redraws
+    fig = Figure(figsize=(14, 7), dpi=100)
+    canvas = FigureCanvasAgg(fig)
+    chart = CandleChart(fig.add_subplot(111), canvas)
+    blit, redraw = Stage("chart.blit"), Stage("chart.redraw")
+    for _ in range(calls):
+        move()
+        draws = chart.full_draws
+        t0 = time.perf_counter_ns()
+        chart.show(sym, 5, sim.get_history(sym, 5), [], sim.bid[i], sim.ask[i])
+        dt = time.perf_counter_ns() - t0
+        (redraw if chart.full_draws != draws else blit).samples.append(dt)
+    for st in (blit, redraw):
+        if st.samples:
+            stages[st.name] = st.result()
+
+    # grids, over real Tk widgets when there is a display
+    kind, dom_tree, pos_tree, listbox = _widgets()
+    dom = TreeGrid(dom_tree, DOM_COLUMNS)
+    bench("ui.dom", lambda: dom.update(dom_rows(sim.depth(sym, 15))), setup=move)
+    p = Portfolio(syms, cash=1e12)
+    sim.attach(p)
+    for s in syms[:20]:
+        sim.submit(s, 'buy', 10)
+    pos = TreeGrid(pos_tree, POS_COLUMNS)
+    bench("ui.positions", lambda: pos.update(position_rows(p.positions())), setup=lambda: sim.step(1))
+    tape = VirtualList(listbox, None, capacity=5000, rows=12)
+    lines = [(f"00:00:00.000  {syms[j % symbols]:6}  BUY   1,000 @  100.000", "#79c0ff") for j in range(per_frame)]
+    bench("ui.tape", lambda: tape.extend(lines), ticks=per_frame)
+
+    for name, a in allocs.items():
+        stages[name].update(a)
+    return {'symbols': symbols, 'rate': rate, 'batch': batch, 'widgets': kind, 'stages': stages,
+            'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def _run_isolated(args, results):
+    symbols, rate, calls, batch, seed, profile = args
+    if profile:
+        prof = cProfile.Profile()
+        out = prof.runcall(run_config, symbols, rate, calls, batch, seed)
+        path = f"{profile}-{symbols}-{int(rate)}.prof"
+        prof.dump_stats(path)
+        out['profile'] = path
+    else:
+        out = run_config(symbols, rate, calls, batch, seed)
+    results.put(out)
+
+
+def startup(runs):
+    """Median import time per module group and time to the first tick of a headless session, in ms."""
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def python(code):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=here, check=True).stdout
+        return out, (time.perf_counter() - t0) * 1000
+
+    imports = {}
+    for name, mods in IMPORTS.items():
+        code = f"import time; t = time.perf_counter(); import {mods}; print((time.perf_counter() - t) * 1000)"
+        imports[name] = float(np.median([float(python(code)[0]) for _ in range(runs)]))
+    ticks, procs = [], []
+    for _ in range(runs):
+        out, ms = python(FIRST_TICK)
+        ticks.append(json.loads(out)['first_tick'])
+        procs.append(ms)
+    return {'runs': runs, 'import_ms': imports, 'first_tick_ms': float(np.median(ticks)),
+            'process_ms': float(np.median(procs))}
+
+
+def _meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'time': time.strftime("%Y-%m-%dT%H:%M:%S%z"), 'python': platform.python_version(),
+            'numpy': np.__version__, 'matplotlib': matplotlib.__version__, 'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+def compare(old, new):
+    """Print p50 per stage of new against old, matched by (symbols, rate)."""
+    base = {(r['symbols'], r['rate']): r['stages'] for r in old['results']}
+    print(f"comparing {new['meta']['commit'] or 'current'} against {old['meta']['commit'] or 'baseline'}")
+    for r in new['results']:
+        prev = base.get((r['symbols'], r['rate']))
+        if prev is None:
+            continue
+        print(f"  {r['symbols']:,} symbols @ {r['rate']:,.0f} ticks/s")
+        for name, st in r['stages'].items():
+            if name in prev:
+                ratio = st['p50_us'] / prev[name]['p50_us']
+                flag = "  REGRESSION" if ratio > 1.2 else ""
+                print(f"    {name:16} {prev[name]['p50_us']:10.1f} -> {st['p50_us']:10.1f} us  x{ratio:5.2f}{flag}")
+    if old.get('startup') and new.get('startup'):
+        print("  startup")
+        a, b = old['startup'], new['startup']
+        rows = [(f"import.{k}", v, b['import_ms'][k]) for k, v in a['import_ms'].items() if k in b['import_ms']]
+        rows.append(("first_tick", a['first_tick_ms'], b['first_tick_ms']))
+        for name, x, y in rows:
+            ratio = y / x if x else float('nan')
+            flag = "  REGRESSION" if ratio > 1.2 else ""
+            print(f"    {name:16} {x:10.1f} -> {y:10.1f} ms  x{ratio:5.2f}{flag}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Headless benchmarks for the simulator, book, chart and UI paths")
+    ap.add_argument("--symbols", type=int, nargs="+", default=[10, 1000])
+    ap.add_argument("--rates", type=float, nargs="+", default=[100, 5000], help="ticks/s fed to the UI stages")
+    ap.add_argument("--calls", type=int, default=300, help="timed calls per stage")
+    ap.add_argument("--batch", type=int, default=16, help="steps per sim.step call")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default=None, help="JSON results file (default: bench-<commit>.json)")
+    ap.add_argument("--compare", metavar="JSON", help="earlier results to compare against")
+    ap.add_argument("--profile", metavar="PREFIX", help="also write a cProfile dump per configuration")
+    ap.add_argument("--startup-runs", type=int, default=5, help="fresh interpreters per startup measurement (0 skips)")
+    args = ap.parse_args(argv)
+
+    start = None
+    if args.startup_runs:
+        start = startup(args.startup_runs)
+        print(f"startup (median of {start['runs']}): first tick {start['first_tick_ms']:.1f} ms after imports "
+              f"began, {start['process_ms']:.1f} ms including interpreter start")
+        for name, ms in start['import_ms'].items():
+            print(f"  import {name:12} {ms:8.1f} ms")
+
+    # every configuration runs in a fresh process so peak RSS and allocator state are its own
+    ctx = get_context("spawn")
+    results = []
+    for symbols in args.symbols:
+        for rate in args.rates:
+            q = ctx.Queue()
+            p = ctx.Process(target=_run_isolated, args=((symbols, rate, args.calls, args.batch, args.seed,
+                                                          args.profile), q))
+            p.start()
+            r = q.get()
+            p.join()
+            results.append(r)
+            print(f"{symbols:,} symbols @ {rate:,.0f} ticks/s ({r['widgets']} widgets), "
+                  f"peak RSS {r['peak_rss_kib'] / 1024:,.0f} MiB")
+            for name, st in r['stages'].items():
+                rate_s = f"{st['ticks_per_s']:14,.0f} ticks/s" if 'ticks_per_s' in st else " " * 22
+                alloc = f"{st['alloc_bytes_per_tick']:10,.0f} B/tick" if 'alloc_bytes_per_tick' in st else ""
+                print(f"  {name:16} p50 {st['p50_us']:9.1f} us  p99 {st['p99_us']:9.1f} us {rate_s} {alloc}")
+            if 'profile' in r:
+                pstats.Stats(r['profile']).sort_stats("cumulative").print_stats(15)
+
+    report = {'meta': _meta(), 'args': vars(args), 'startup': start, 'results': results}
+    out = args.out or f"bench-{(report['meta']['commit'] or 'local')[:10]}.json"
+    with open(out, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"wrote {out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
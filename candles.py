@@ -0,0 +1,211 @@
+import threading
+
+import numpy as np
+
+from indicators import make
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class _Frame:
+    """Ring buffer of bars for every symbol at one timeframe.
+
+    Rows are bars, columns are symbols. Each bar is written twice (slot and
+    slot + capacity) so the newest n bars are always a single contiguous slice.
+    """
+
+    def __init__(self, tf, n_symbols, capacity):
+        self.tf = tf
+        self.capacity = capacity
+        self.count = 0
+        self.cur = None
+        self.pend = None
+        self.studies = []
+        self.time = np.zeros(2*capacity, np.int64)
+        self.open = np.zeros((2*capacity, n_symbols))
+        self.high = np.zeros((2*capacity, n_symbols))
+        self.low = np.zeros((2*capacity, n_symbols))
+        self.close = np.zeros((2*capacity, n_symbols))
+        self.volume = np.zeros((2*capacity, n_symbols), np.int64)
+
+    @property
+    def slot(self):
+        return (self.count - 1) % self.capacity
+
+    def roll(self, t):
+        if self.count:
+            s = self.slot
+            for ind in self.studies:
+                ind.close(s)
+        self.count += 1
+        self.cur = t
+        s = self.slot
+        self.time[s] = self.time[s + self.capacity] = t
+        return s
+
+    def row(self, s):
+        return self.open[s], self.high[s], self.low[s], self.close[s], self.volume[s]
+
+    def write(self, s, cols, o, h, l, c, v):
+        for s2 in (s, s + self.capacity):
+            self.open[s2, cols] = o
+            self.high[s2, cols] = h
+            self.low[s2, cols] = l
+            self.close[s2, cols] = c
+            self.volume[s2, cols] = v
+
+    def window(self, n=None):
+        n = min(self.count, self.capacity if n is None else n)
+        end = self.slot + self.capacity + 1
+        return slice(end - n, end)
+
+
+class CandleStore:
+    """OHLCV bars for a universe of symbols on a shared timeline.
+
+    Only the base (smallest) timeframe is touched by ticks. Higher timeframes
+    take a completed base bar when it closes, and merge in the live base bar
+    when they are read. Reads roll and write the higher frames, so ingest and
+    every read take the store lock; the simulator thread ingests while the UI
+    and gateway threads read.
+    """
+
+    def __init__(self, symbols, prices, timeframes=(5, 15, 30, 60, 300), capacity=600):
+        self.symbols = list(symbols)
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        self.timeframes = sorted(timeframes)
+        self.base = self.timeframes[0]
+        if any(tf % self.base for tf in self.timeframes):
+            raise ValueError(f"timeframes must be multiples of {self.base}s")
+        self.last = np.array(prices, dtype=float)
+        self.frames = {tf: _Frame(tf, len(self.symbols), capacity) for tf in self.timeframes}
+        self.studies = {}
+        self.lock = threading.Lock()
+
+    def _roll_base(self, t):
+        f = self.frames[self.base]
+        if f.count:
+            s = f.slot
+            for tf in self.timeframes[1:]:
+                self._fold(self.frames[tf], f.cur, *f.row(s))
+            prev = f.close[s].copy()
+        else:
+            prev = self.last
+        f.write(f.roll(t), slice(None), prev, prev, prev, prev, 0)
+
+    def _fold(self, f, t, o, h, l, c, v):
+        hb = t // f.tf * f.tf
+        if hb != f.cur:
+            f.roll(hb)
+            f.pend = None
+        if f.pend is None:
+            f.pend = [o.copy(), h.copy(), l.copy(), c.copy(), v.copy()]
+        else:
+            p = f.pend
+            np.maximum(p[1], h, out=p[1])
+            np.minimum(p[2], l, out=p[2])
+            p[3][:] = c
+            p[4] += v
+        f.write(f.slot, slice(None), *f.pend)
+
+    def _sync(self, f, cols):
+        base = self.frames[self.base]
+        lb = base.cur // f.tf * f.tf
+        if lb != f.cur:
+            f.roll(lb)
+            f.pend = None
+        bs = base.slot
+        o, h, l, c, v = (a[bs, cols] for a in (base.open, base.high, base.low, base.close, base.volume))
+        if f.pend is not None:
+            po, ph, pl, _, pv = (a[cols] for a in f.pend)
+            o, h, l, v = po, np.maximum(ph, h), np.minimum(pl, l), pv + v
+        f.write(f.slot, cols, o, h, l, c, v)
+
+    def ingest(self, batch):
+        """Fold a simulator TickBatch into the base bars."""
+        base = self.frames[self.base]
+        idx = batch.idx
+        buckets = batch.times.astype(np.int64) // self.base * self.base
+        starts = np.concatenate(([0], np.flatnonzero(buckets[1:] != buckets[:-1]) + 1))
+        ends = np.append(starts[1:], len(buckets))
+        highs = np.maximum.reduceat(batch.price, starts, axis=0)
+        lows = np.minimum.reduceat(batch.price, starts, axis=0)
+        vols = np.add.reduceat(np.where(batch.trade, batch.size, 0), starts, axis=0)
+        closes = batch.price[ends - 1]
+
+        with self.lock:
+            for j, st in enumerate(starts):
+                t = int(buckets[st])
+                if t != base.cur:
+                    self._roll_base(t)
+                s = base.slot
+                base.write(s, idx, base.open[s, idx],
+                           np.maximum(base.high[s, idx], highs[j]),
+                           np.minimum(base.low[s, idx], lows[j]),
+                           closes[j], base.volume[s, idx] + vols[j])
+            self.last[idx] = closes[-1]
+
+    def view(self, sym, tf, n=None):
+        """Newest n bars (default: all retained) of one symbol as zero-copy array views."""
+        i = self.index[sym]
+        f = self.frames[tf]
+        with self.lock:
+            if tf != self.base and self.frames[self.base].count:
+                self._sync(f, i)
+            w = f.window(n)
+        out = {'time': f.time[w]}
+        for name in FIELDS:
+            out[name] = getattr(f, name)[w, i]
+        return out
+
+    def frame(self, tf, n=None):
+        """Newest n bars of every symbol as (bars, symbols) array views."""
+        f = self.frames[tf]
+        with self.lock:
+            if tf != self.base and self.frames[self.base].count:
+                self._sync(f, slice(None))
+            w = f.window(n)
+        out = {'time': f.time[w]}
+        for name in FIELDS:
+            out[name] = getattr(f, name)[w]
+        return out
+
+    def add(self, tf, spec):
+        """Attach an indicator (see indicators.make) to a timeframe, backfilled over the bars already held."""
+        with self.lock:
+            return self._add(tf, spec)
+
+    def _add(self, tf, spec):
+        ind = self.studies.get((tf, spec))
+        if ind is None:
+            ind = make(spec)
+            ind.bind(self.frames[tf])
+            self.frames[tf].studies.append(ind)
+            self.studies[(tf, spec)] = ind
+        return ind
+
+    def study(self, sym, tf, spec, n=None):
+        """Newest n values of an indicator's outputs for one symbol, aligned with view(sym, tf, n)."""
+        i = self.index[sym]
+        f = self.frames[tf]
+        with self.lock:
+            ind = self._add(tf, spec)
+            if f.count:
+                if tf != self.base:
+                    self._sync(f, i)
+                # the forming bar's value goes into the shared outputs, so it is written under the lock too
+                ind.live(f.slot, i)
+            w = f.window(n)
+        return {name: a[w, i] for name, a in ind.out.items()}
+
+    def study_frame(self, tf, spec, n=None):
+        """Newest n values of an indicator for every symbol, as (bars, symbols) views aligned with frame(tf, n)."""
+        f = self.frames[tf]
+        with self.lock:
+            ind = self._add(tf, spec)
+            if f.count:
+                if tf != self.base:
+                    self._sync(f, slice(None))
+                ind.live(f.slot, slice(None))
+            w = f.window(n)
+        return {name: a[w] for name, a in ind.out.items()}
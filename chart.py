@@ -0,0 +1,166 @@
+from datetime import datetime
+
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.markers import MarkerStyle
+from matplotlib.patches import Rectangle
+from matplotlib.ticker import FuncFormatter
+
+from metrics import METRICS
+
+UP, DOWN = '#2ea043', '#f85149'
+MARKER_COLORS = {"buy": "#79c0ff", "sell": "#f85149"}
+OVERLAY_COLORS = ("#d2a8ff", "#ffa657", "#56d4dd", "#e3b341")
+
+# bar times are epoch seconds; trade markers are naive local datetimes
+UTC_OFFSET = datetime.now().astimezone().utcoffset().total_seconds()
+
+
+def _marker_path(m):
+    style = MarkerStyle(m)
+    return style.get_path().transformed(style.get_transform())
+
+
+class CandleChart:
+    """Candlestick chart built from persistent artists.
+
+    Closed bars live in one PolyCollection (bodies) and one LineCollection
+    (wicks) and are only rebuilt when a bar opens, the view changes or a new
+    trade marker appears. The live bar and the bid/ask lines are animated
+    artists: an intrabar tick restores the cached background and blits just
+    those over it.
+    """
+
+    def __init__(self, ax, canvas):
+        self.ax = ax
+        self.canvas = canvas
+        self.bodies = PolyCollection([], alpha=0.9, zorder=2)
+        self.wicks = LineCollection([], linewidths=1.8, zorder=1)
+        ax.add_collection(self.wicks)
+        ax.add_collection(self.bodies)
+        self.markers = ax.scatter([], [], s=121, alpha=0.9, zorder=15)
+        self._paths = {'o': _marker_path('o'), 's': _marker_path('s')}
+
+        self.live_body = Rectangle((0, 0), 0, 0, alpha=0.9, zorder=3, animated=True)
+        ax.add_patch(self.live_body)
+        self.live_wick, = ax.plot([], [], linewidth=1.8, zorder=2, animated=True)
+        self.bid_line = ax.axhline(0, color=UP, ls='--', lw=1.5, label='Bid', animated=True)
+        self.ask_line = ax.axhline(0, color=DOWN, ls='--', lw=1.5, label='Ask', animated=True)
+        self.animated = (self.live_wick, self.live_body, self.bid_line, self.ask_line)
+        self.overlays = {}
+
+        ax.grid(True, alpha=0.3, color="#30363d")
+        ax.yaxis.set_major_formatter(FuncFormatter(lambda x, _: f"${x:,.2f}"))
+        ax.tick_params(axis='both', colors='white')
+        self.title = ax.set_title("", fontsize=20, color="#58a6ff", pad=20)
+
+        self.key = None
+        self.view = None
+        self.background = None
+        self.full_draws = 0
+        self.blits = 0
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._blit()
+
+    def _blit(self):
+        for a in self.animated:
+            self.ax.draw_artist(a)
+        for a in self.overlays.values():
+            self.ax.draw_artist(a)
+        self.canvas.blit(self.ax.bbox)
+
+    def _set_live(self, t, w, o, h, l, c, bid, ask):
+        color = UP if c >= o else DOWN
+        self.live_body.set_bounds(t - w/2, min(o, c), w, abs(c - o) or 0.0001)
+        self.live_body.set_color(color)
+        self.live_wick.set_data([t, t], [l, h])
+        self.live_wick.set_color(color)
+        self.bid_line.set_ydata([bid, bid])
+        self.ask_line.set_ydata([ask, ask])
+
+    def _set_overlays(self, dates, overlays):
+        """Study lines, animated so an intrabar tick also moves their last point."""
+        for label in [k for k in self.overlays if k not in overlays]:
+            self.overlays.pop(label).remove()
+        studies = list(dict.fromkeys(label.split('.')[0] for label in overlays))
+        for label, y in overlays.items():
+            line = self.overlays.get(label)
+            if line is None:
+                color = OVERLAY_COLORS[studies.index(label.split('.')[0]) % len(OVERLAY_COLORS)]
+                line, = self.ax.plot([], [], color=color, lw=1.3, alpha=0.9, zorder=4, animated=True,
+                                     ls='--' if label.endswith(('.upper', '.lower')) else '-')
+                self.overlays[label] = line
+            line.set_data(dates, y)
+
+    def show(self, sym, tf, hist, markers, bid, ask, overlays=None):
+        """Bring the chart up to date; redraws everything only when something other than the live bar changed.
+
+        overlays maps a label to values aligned with hist, e.g. CandleStore.study outputs.
+        """
+        times = hist['time']
+        n = len(times)
+        if n < 2:
+            return
+        overlays = overlays or {}
+        key = (sym, tf, n, times[0], times[-1], len(markers), tuple(overlays))
+        dates = (times + UTC_OFFSET) / 86400.0
+        w = (dates[-1] - dates[-2]) * 0.9
+        o, h, l, c = (float(hist[f][-1]) for f in ('open', 'high', 'low', 'close'))
+        self._set_live(dates[-1], w, o, h, l, c, bid, ask)
+        self._set_overlays(dates, overlays)
+
+        lo, hi = min(l, bid), max(h, ask)
+        for y in overlays.values():
+            if y[-1] == y[-1]:  # not NaN
+                lo, hi = min(lo, y[-1]), max(hi, y[-1])
+        if key == self.key and self.background is not None and self.view[0] <= lo and hi <= self.view[1]:
+            with METRICS.span("chart.blit"):
+                self.canvas.restore_region(self.background)
+                self._blit()
+            self.blits += 1
+            return
+        self.key = key
+        self._rebuild(sym, tf, dates, w, hist, markers, lo, hi, overlays)
+
+    def _rebuild(self, sym, tf, dates, w, hist, markers, lo, hi, overlays):
+        t, o, h, l, c = dates[:-1], hist['open'][:-1], hist['high'][:-1], hist['low'][:-1], hist['close'][:-1]
+        bottom = np.minimum(o, c)
+        top = np.maximum(np.maximum(o, c), bottom + 0.0001)
+        x0, x1 = t - w/2, t + w/2
+        self.bodies.set_verts(np.stack([np.column_stack(p) for p in
+                                        ((x0, bottom), (x0, top), (x1, top), (x1, bottom))], axis=1))
+        colors = np.where(c >= o, UP, DOWN)
+        self.bodies.set_facecolors(colors)
+        self.bodies.set_edgecolors(colors)
+        self.wicks.set_segments(np.stack([np.column_stack((t, l)), np.column_stack((t, h))], axis=1))
+        self.wicks.set_colors(colors)
+
+        if markers:
+            self.markers.set_offsets([(mdates.date2num(m[0]), m[1]) for m in markers])
+            self.markers.set_paths([self._paths['o' if m[2] in ("buy", "sell") else 's'] for m in markers])
+            self.markers.set_facecolors([MARKER_COLORS.get(m[2], "#ffa657") for m in markers])
+            self.markers.set_edgecolors('none')
+        else:
+            self.markers.set_offsets(np.empty((0, 2)))
+
+        lo, hi = min(lo, hist['low'].min()), max(hi, hist['high'].max())
+        for y in overlays.values():
+            if np.isfinite(y).any():
+                lo, hi = min(lo, np.nanmin(y)), max(hi, np.nanmax(y))
+        pad = (hi - lo) * 0.05 or 1.0
+        self.view = (lo - pad/2, hi + pad/2)
+        self.ax.set_ylim(lo - pad, hi + pad)
+        self.ax.set_xlim(dates[0] - w, dates[-1] + w)
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S' if tf <= 60 else '%H:%M'))
+        self.title.set_text(f"{sym} • {tf_label(tf)}")
+        self.full_draws += 1
+        with METRICS.span("chart.draw"):
+            self.canvas.draw()
+
+
+def tf_label(tf):
+    return f"{tf}S" if tf < 60 else f"{tf // 60}M"
@@ -0,0 +1,177 @@
+import itertools
+import threading
+import time
+from collections import deque, namedtuple
+
+
+class Tick(namedtuple("Tick", "sym price bid ask time")):
+    __slots__ = ()
+    kind = 'tick'
+
+
+class Dom(namedtuple("Dom", "sym")):
+    __slots__ = ()
+    kind = 'dom'
+
+
+class Trade(namedtuple("Trade", "sym side size price time")):
+    __slots__ = ()
+    kind = 'trade'
+
+
+class Fill(namedtuple("Fill", "sym side qty price order_id")):
+    __slots__ = ()
+    kind = 'fill'
+
+
+class MarginCall(namedtuple("MarginCall", "equity used_margin marked", defaults=((),))):
+    """marked: (sym, qty) for positions the book couldn't absorb, closed at the last price instead."""
+    __slots__ = ()
+    kind = 'margin_call'
+
+
+CONFLATABLE = {'tick', 'dom'}        # state updates: only the latest per symbol matters
+LOSSLESS = {'fill', 'margin_call'}  # kept apart from the drop policy, in a much larger buffer
+LOSSLESS_CAPACITY = 65536            # batches; only a stalled consumer gets near it
+POLICIES = ('drop_oldest', 'conflate')
+
+
+class Subscription:
+    """One consumer's bounded buffer.
+
+    Batches are appended to a deque, which is atomic under the GIL, so the
+    publisher never blocks on a consumer. With 'drop_oldest' a full buffer
+    drops the oldest batch. With 'conflate', tick/dom events instead collapse
+    to the latest one per (kind, symbol), and only the other events are
+    buffered; that path takes a short lock once per batch.
+
+    A batch holding fills or margin calls goes to a separate buffer of
+    `lossless_capacity` batches instead, which only drops (and counts in
+    `overflowed`) when a consumer stops draining. Every batch is numbered
+    as it arrives and drain() merges the two buffers back into that order,
+    so a fill never overtakes the trade published before it.
+    """
+
+    def __init__(self, name, capacity=1024, policy='drop_oldest', lossless_capacity=LOSSLESS_CAPACITY):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy}")
+        self.name = name
+        self.capacity = capacity
+        self.policy = policy
+        self.batches = deque(maxlen=capacity)
+        self.lossless = deque(maxlen=lossless_capacity)
+        self._seq = itertools.count()
+        self.latest = {}
+        self._lock = threading.Lock() if policy == 'conflate' else None
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.overflowed = 0
+        self.conflated = 0
+        self.latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    @staticmethod
+    def _append(q, entry):
+        """Append to a bounded deque; returns how many events fell off the front."""
+        lost = 0
+        if len(q) == q.maxlen:
+            try:
+                lost = len(q[0][2])
+            except IndexError:  # the consumer emptied it in the meantime
+                pass
+        q.append(entry)
+        return lost
+
+    def _put(self, stamp, events):
+        self.published += len(events)
+        # next() on a count is atomic under the GIL, so every batch gets its own place in the order
+        seq = next(self._seq)
+        lossless = any(e.kind in LOSSLESS for e in events)
+        if self._lock is not None:
+            with self._lock:
+                rest = []
+                for e in events:
+                    if e.kind in CONFLATABLE:
+                        key = (e.kind, e.sym)
+                        prev = self.latest.get(key)
+                        if prev is None:
+                            self.latest[key] = (stamp, e)
+                        else:
+                            self.conflated += 1
+                            self.latest[key] = (prev[0], e)
+                    else:
+                        rest.append(e)
+            events = rest
+        if not events:
+            return
+        if lossless:
+            self.overflowed += self._append(self.lossless, (seq, stamp, events))
+        else:
+            self.dropped += self._append(self.batches, (seq, stamp, events))
+
+    def drain(self):
+        """Everything buffered so far in publish order (conflated state events last)."""
+        out = []
+        oldest = None
+        entries = []
+        for q in (self.lossless, self.batches):
+            while q:
+                entries.append(q.popleft())
+        entries.sort(key=lambda entry: entry[0])
+        for _, stamp, events in entries:
+            oldest = stamp if oldest is None else min(oldest, stamp)
+            out.extend(events)
+        if self._lock is not None and self.latest:
+            with self._lock:
+                latest, self.latest = self.latest, {}
+            for stamp, e in latest.values():
+                oldest = stamp if oldest is None else min(oldest, stamp)
+                out.append(e)
+        if oldest is not None:
+            ms = (time.perf_counter() - oldest) * 1000
+            self.latency_ms = ms
+            self.max_latency_ms = max(self.max_latency_ms, ms)
+        self.delivered += len(out)
+        return out
+
+    def depth(self):
+        return sum(len(e) for _, _, e in list(self.batches)) + len(self.latest) + \
+            sum(len(e) for _, _, e in list(self.lossless))
+
+    def stats(self):
+        return {'policy': self.policy, 'capacity': self.capacity, 'depth': self.depth(),
+                'published': self.published, 'delivered': self.delivered, 'dropped': self.dropped,
+                'overflowed': self.overflowed, 'conflated': self.conflated, 'latency_ms': self.latency_ms,
+                'max_latency_ms': self.max_latency_ms}
+
+
+class EventBus:
+    """Fan-out of event batches from the simulator to any number of subscribers."""
+
+    def __init__(self):
+        self.subs = ()
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, name, capacity=1024, policy='drop_oldest', lossless_capacity=LOSSLESS_CAPACITY):
+        sub = Subscription(name, capacity, policy, lossless_capacity)
+        with self._lock:
+            self.subs = self.subs + (sub,)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self.subs = tuple(s for s in self.subs if s is not sub)
+
+    def publish(self, events):
+        """Deliver one batch (typically one simulation step) to every subscriber."""
+        if not events:
+            return
+        self.batches += 1
+        stamp = time.perf_counter()
+        for sub in self.subs:
+            sub._put(stamp, events)
+
+    def stats(self):
+        return {'batches': self.batches, 'subscribers': {s.name: s.stats() for s in self.subs}}
@@ -0,0 +1,779 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+from urllib.parse import parse_qs, urlsplit
+
+from metrics import METRICS
+from orders import close_position, place_order
+from simulator import TIMEFRAMES
+
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_MESSAGE = 1 << 20
+DEPTH = 15
+HISTORY = 200
+SNDBUF = 64 * 1024
+CHANNELS = ('ticks', 'trades', 'candles', 'dom', 'account')
+WILDCARD = ('ticks', 'trades')  # channels that accept symbols="*"
+
+
+def dumps(obj):
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def ws_frame(payload, opcode=0x1, mask=None):
+    """One unfragmented WebSocket frame. Servers send unmasked frames, clients must pass a mask."""
+    n = len(payload)
+    bit = 0x80 if mask else 0
+    if n < 126:
+        head = struct.pack("!BB", 0x80 | opcode, bit | n)
+    elif n < 65536:
+        head = struct.pack("!BBH", 0x80 | opcode, bit | 126, n)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, bit | 127, n)
+    if mask:
+        return head + mask + _unmask(payload, mask)
+    return head + payload
+
+
+def _unmask(data, mask):
+    n = len(data)
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(data, "big") ^ int.from_bytes(key, "big")).to_bytes(n, "big")
+
+
+async def read_message(reader):
+    """Next (opcode, payload), joining fragments. Control frames come back as soon as they arrive."""
+    parts = []
+    opcode = None
+    while True:
+        b0, b1 = await reader.readexactly(2)
+        op = b0 & 0x0F
+        n = b1 & 0x7F
+        if n == 126:
+            n = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif n == 127:
+            n = struct.unpack("!Q", await reader.readexactly(8))[0]
+        if n > MAX_MESSAGE:
+            raise ValueError("message too big")
+        mask = await reader.readexactly(4) if b1 & 0x80 else None
+        data = await reader.readexactly(n)
+        if mask:
+            data = _unmask(data, mask)
+        if op >= 0x8:
+            return op, data
+        if op:
+            opcode = op
+        parts.append(data)
+        if sum(map(len, parts)) > MAX_MESSAGE:
+            raise ValueError("message too big")
+        if b0 & 0x80:
+            return opcode, b"".join(parts)
+
+
+class Client:
+    """Outgoing side of one WebSocket connection.
+
+    Three buffers, written out in this order on flush(): `replies` (order
+    acks, fills, snapshots) is never dropped; `pending` holds the latest
+    message per (channel, symbol); `tape` is a bounded Time & Sales queue
+    that drops its oldest prints. While the socket is backed up the client
+    is `blocked` and messages keep collapsing in `pending`; a conflated DOM
+    delta or candle update is replaced by a full snapshot, since a client
+    can only apply a delta on top of the previous one.
+    """
+
+    def __init__(self, cid, writer, tape=1024):
+        self.id = cid
+        self.writer = writer
+        self.replies = deque()
+        self.pending = {}
+        self.tape = deque(maxlen=tape)
+        self.stale = set()
+        self.subs = set()
+        self.sent = 0
+        self.conflated = 0
+        self.dropped = 0
+        self.blocked = False
+        self.closed = False
+
+    def reply(self, frame):
+        self.replies.append(frame)
+
+    def state(self, key, frame, full=None):
+        if key in self.stale:
+            self.stale.discard(key)
+            self.replies.append(full or frame)
+            return
+        if key in self.pending:
+            self.conflated += 1
+            frame = full or frame
+        self.pending[key] = frame
+
+    def stream(self, frame):
+        if len(self.tape) == self.tape.maxlen:
+            self.dropped += 1
+        self.tape.append(frame)
+
+    def flush(self):
+        if self.blocked or self.closed:
+            return
+        out = list(self.replies)
+        self.replies.clear()
+        if self.pending:
+            out.extend(self.pending.values())
+            self.pending = {}
+        out.extend(self.tape)
+        self.tape.clear()
+        if not out:
+            return
+        self.writer.write(b"".join(out))
+        self.sent += len(out)
+        if self.writer.transport.get_write_buffer_size() > SNDBUF:
+            self.blocked = True
+            asyncio.ensure_future(self._drain())
+
+    async def _drain(self):
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            self.closed = True
+            return
+        self.blocked = False
+        self.flush()
+
+
+class Gateway:
+    """asyncio WebSocket/HTTP front end for a simulator and its portfolio.
+
+    A pump task drains the simulator bus (conflating) `fps` times a second.
+    A single collector thread turns the batch into messages: one encoded
+    frame per symbol and channel, shared by every subscriber. DOM updates
+    are deltas against the previous frame, and candle updates carry just
+    the last two bars. The loop thread then hands each frame to the clients
+    subscribed to that (channel, symbol), and each client's flush task
+    writes at its own pace.
+
+    WebSocket clients send JSON ops: subscribe/unsubscribe (channel,
+    symbols, tf for candles), order, close, cancel_all and ping. The same
+    order operations are available over plain HTTP.
+    """
+
+    def __init__(self, sim, portfolio, host="127.0.0.1", port=8765, fps=20, tape=1024):
+        self.sim = sim
+        self.portfolio = portfolio
+        self.host = host
+        self.port = port
+        self.fps = fps
+        self.tape = tape
+        self.feed = sim.bus.subscribe("gateway", capacity=4096, policy="conflate")
+        self.clients = {}
+        self.subs = {}
+        self.candle_tfs = {}
+        self.fresh = set()
+        self.books = {}
+        self.collector = ThreadPoolExecutor(1, thread_name_prefix="gateway-collect")
+        self.workers = ThreadPoolExecutor(4, thread_name_prefix="gateway-orders")
+        self.next_id = 0
+        self.frames = 0
+        self.fanout = 0
+        self.errors = 0
+        self.pump_ms = 0.0
+        self.server = None
+        METRICS.gauge("gateway.clients", lambda: len(self.clients))
+        METRICS.counter("gateway.frames", lambda: self.frames)
+        METRICS.counter("gateway.errors", lambda: self.errors)
+        METRICS.counter("gateway.feed_overflowed", lambda: self.feed.overflowed)
+        METRICS.counter("gateway.dropped", lambda: sum(c.dropped for c in list(self.clients.values())))
+
+    # --- subscriptions -------------------------------------------------
+
+    def _subscribe(self, client, channel, symbols, tf=None):
+        if channel not in CHANNELS:
+            raise ValueError(f"Unknown channel {channel}")
+        if channel == 'account':
+            symbols = ['*']
+        elif symbols == '*':
+            if channel not in WILDCARD:
+                raise ValueError(f"{channel} needs explicit symbols")
+            symbols = ['*']
+        else:
+            for s in symbols:
+                if s not in self.sim.index:
+                    raise ValueError(f"Unknown symbol {s}")
+        if channel == 'candles':
+            tf = int(tf or 5)
+            # a sharded market keeps its candles in the workers, which all use the default timeframes
+            frames = TIMEFRAMES if self.sim.candles is None else self.sim.candles.frames
+            if tf not in frames:
+                raise ValueError(f"Unknown timeframe {tf}")
+            channel = f"candles:{tf}"
+        for s in symbols:
+            key = (channel, s)
+            if key in client.subs:
+                continue
+            client.subs.add(key)
+            self.subs.setdefault(key, set()).add(client)
+            if channel.startswith('candles:'):
+                self.candle_tfs.setdefault(s, set()).add(tf)
+            if channel != 'trades' and (s != '*' or channel == 'account'):
+                client.stale.add(key)
+                self.fresh.add(key)
+
+    def _unsubscribe(self, client, keys):
+        for key in keys:
+            client.subs.discard(key)
+            client.stale.discard(key)
+            client.pending.pop(key, None)
+            subs = self.subs.get(key)
+            if subs is None:
+                continue
+            subs.discard(client)
+            if not subs:
+                del self.subs[key]
+                channel, sym = key
+                if channel.startswith('candles:'):
+                    self.candle_tfs.get(sym, set()).discard(int(channel[8:]))
+                elif channel == 'dom':
+                    self.books.pop(sym, None)
+
+    def _watched(self, channel, sym):
+        return (channel, sym) in self.subs or (channel, '*') in self.subs
+
+    # --- collector thread ----------------------------------------------
+
+    def _dom_frames(self, sym):
+        book = self.sim.depth(sym, DEPTH)
+        new = {side: {p: (s, u) for p, s, u in book[side]} for side in ('bids', 'asks')}
+        old = self.books.get(sym)
+        self.books[sym] = new
+        full = ws_frame(dumps({'type': 'dom', 'sym': sym, 'bids': book['bids'], 'asks': book['asks']}))
+        if old is None:
+            return full, full
+        delta = {'type': 'dom_delta', 'sym': sym}
+        changed = False
+        for side in ('bids', 'asks'):
+            o, n = old[side], new[side]
+            d = [[p, s, u] for p, (s, u) in n.items() if o.get(p) != (s, u)]
+            d += [[p, 0, 0] for p in o if p not in n]
+            changed |= bool(d)
+            delta[side] = d
+        return (ws_frame(dumps(delta)) if changed else None), full
+
+    def _candle_frames(self, sym, tf):
+        h = self.sim.get_history(sym, tf, HISTORY)
+        bars = [list(r) for r in zip(h['time'].tolist(), h['open'].tolist(), h['high'].tolist(),
+                                     h['low'].tolist(), h['close'].tolist(), h['volume'].tolist())]
+        live = ws_frame(dumps({'type': 'candle', 'sym': sym, 'tf': tf, 'bars': bars[-2:], 'ts': time.time()}))
+        full = ws_frame(dumps({'type': 'candles', 'sym': sym, 'tf': tf, 'bars': bars}))
+        return live, full
+
+    def _account_dict(self):
+        p = self.portfolio
+        return {'cash': p.cash, 'equity': p.equity, 'unreal': p.unreal, 'used_margin': p.used_margin,
+                'free_margin': p.free_margin, 'positions': p.positions()}
+
+    def _collect(self, fresh):
+        """Build this frame's messages from the bus and new subscriptions.
+
+        Items are (channel, sym, frame, full, mode): mode 'state' is conflated
+        per client (full replaces a conflated delta), 'stream' goes to the
+        bounded tape and 'reply' is never dropped.
+        """
+        ticks, doms, trades, private = {}, set(), [], []
+        for e in self.feed.drain():
+            kind = e.kind
+            if kind == 'tick':
+                ticks[e.sym] = e
+            elif kind == 'dom':
+                doms.add(e.sym)
+            elif kind == 'trade':
+                trades.append(e)
+            else:
+                private.append(e)
+        now = time.time()
+        out = []
+        data = self.sim.data
+        for channel, sym in fresh:
+            if channel == 'ticks' and sym != '*' and sym not in ticks:
+                d = data[sym]
+                out.append(('ticks', sym, ws_frame(dumps({'type': 'tick', 'sym': sym, 'price': d['price'],
+                                                          'bid': d['bid'], 'ask': d['ask'], 'ts': now})),
+                            None, 'state'))
+            elif channel == 'dom' and sym not in doms:
+                doms.add(sym)
+                self.books.pop(sym, None)
+        for sym, t in ticks.items():
+            if self._watched('ticks', sym):
+                out.append(('ticks', sym, ws_frame(dumps({'type': 'tick', 'sym': sym, 'price': t.price, 'bid': t.bid,
+                                                          'ask': t.ask, 'time': t.time, 'ts': now})),
+                            None, 'state'))
+        candles = {(sym, tf) for sym in ticks for tf in tuple(self.candle_tfs.get(sym, ()))}
+        candles |= {(sym, int(ch[8:])) for ch, sym in fresh if ch.startswith('candles:')}
+        for sym, tf in candles:
+            if (f"candles:{tf}", sym) in self.subs:
+                out.append((f"candles:{tf}", sym, *self._candle_frames(sym, tf), 'state'))
+        for sym in doms:
+            if ('dom', sym) in self.subs:
+                delta, full = self._dom_frames(sym)
+                if delta is not None or ('dom', sym) in fresh:
+                    out.append(('dom', sym, delta or full, full, 'state'))
+        for t in trades:
+            if self._watched('trades', t.sym):
+                out.append(('trades', t.sym, ws_frame(dumps({'type': 'trade', 'sym': t.sym, 'side': t.side,
+                                                             'size': t.size, 'price': t.price, 'time': t.time})),
+                            None, 'stream'))
+        if ('account', '*') in self.subs and (private or ticks or ('account', '*') in fresh):
+            for e in private:
+                out.append(('account', '*', ws_frame(dumps({'type': e.kind, **e._asdict()})), None, 'reply'))
+            out.append(('account', '*', ws_frame(dumps({'type': 'account', **self._account_dict()})), None, 'state'))
+        return out
+
+    # --- loop thread -------------------------------------------------------
+
+    def _fan_out(self, items):
+        subs = self.subs
+        touched = set()
+        n = 0
+        for channel, sym, frame, full, mode in items:
+            key = (channel, sym)
+            targets = list(subs.get(key, ()))
+            if channel in WILDCARD and sym != '*':
+                targets += subs.get((channel, '*'), ())
+            for c in targets:
+                if mode == 'state':
+                    c.state(key, frame, full)
+                elif mode == 'stream':
+                    c.stream(frame)
+                else:
+                    c.reply(frame)
+            touched.update(targets)
+            n += len(targets)
+        for c in touched:
+            c.flush()
+        self.frames += len(items)
+        self.fanout += n
+
+    async def _pump(self):
+        loop = asyncio.get_running_loop()
+        collect, fan_out = METRICS.span("gateway.collect"), METRICS.span("gateway.fan_out")
+        while True:
+            t0 = time.perf_counter()
+            fresh, self.fresh = self.fresh, set()
+            t1 = time.perf_counter_ns()
+            try:
+                items = await loop.run_in_executor(self.collector, self._collect, fresh)
+                collect.record(time.perf_counter_ns() - t1)
+                with fan_out:
+                    self._fan_out(items)
+            except Exception:
+                # a frame that fails to build is dropped; the pump has to keep serving everyone else
+                self.errors += 1
+                traceback.print_exc()
+            self.pump_ms = (time.perf_counter() - t0) * 1000
+            await asyncio.sleep(max(0.0, 1 / self.fps - self.pump_ms / 1000))
+
+    # --- operations shared by WebSocket and HTTP -------------------------
+
+    def _execution(self, ex):
+        r = ex.resting
+        return {'order_id': ex.order_id, 'side': ex.side, 'requested': ex.requested, 'filled': ex.filled,
+                'vwap': ex.vwap, 'resting': None if r is None else {'id': r.id, 'price': r.price, 'qty': r.qty}}
+
+    def _order(self, msg):
+        side, typ, qty, price = msg['side'], msg.get('type', 'MARKET'), msg['qty'], msg.get('price')
+        if not isinstance(side, str) or not isinstance(typ, str):
+            raise ValueError("side and type must be strings")
+        if isinstance(qty, bool) or not isinstance(qty, int):
+            raise ValueError("qty must be an integer")
+        if price is not None and (isinstance(price, bool) or not isinstance(price, (int, float))):
+            raise ValueError("price must be a number")
+        ex = place_order(self.sim, self.portfolio, msg['sym'], side.lower(), qty, typ.upper(),
+                         None if price is None else float(price))
+        return {'type': 'order', **self._execution(ex)}
+
+    def _close(self, msg):
+        done = close_position(self.sim, self.portfolio, msg['sym'])
+        if done is None:
+            raise ValueError(f"No open position in {msg['sym']}")
+        ex, pnl = done
+        return {'type': 'closed', 'sym': msg['sym'], 'pnl': pnl, **self._execution(ex)}
+
+    def _cancel_all(self, msg):
+        if msg['sym'] not in self.sim.index:
+            raise ValueError(f"Unknown symbol {msg['sym']}")
+        return {'type': 'cancelled', 'sym': msg['sym'], 'count': len(self.sim.cancel_all(msg['sym']))}
+
+    async def _run_op(self, fn, msg):
+        loop = asyncio.get_running_loop()
+        try:
+            out = await loop.run_in_executor(self.workers, fn, msg)
+        except (KeyError, ValueError, TypeError, OverflowError) as e:
+            out = {'type': 'error', 'message': str(e) if not isinstance(e, KeyError) else f"Missing field {e}"}
+        if 'ref' in msg:
+            out['ref'] = msg['ref']
+        return out
+
+    # --- connections --------------------------------------------------------
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = (lines[0].split(" ") + ["", ""])[:3]
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        try:
+            if headers.get("upgrade", "").lower() == "websocket":
+                await self._websocket(reader, writer, headers)
+            else:
+                await self._http(reader, writer, method, target, headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _http(self, reader, writer, method, target, headers):
+        url = urlsplit(target)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = {}
+        n = int(headers.get("content-length", 0) or 0)
+        status = "200 OK"
+        try:
+            if n:
+                body = json.loads(await reader.readexactly(n))
+                if not isinstance(body, dict):
+                    raise ValueError("Expected a JSON object")
+            if method == "GET" and url.path == "/metrics":
+                out = METRICS.prometheus()
+            elif method == "GET" and url.path == "/symbols":
+                out = {'symbols': self.sim.symbols}
+            elif method == "GET" and url.path == "/stats":
+                out = self.stats()
+            elif method == "GET" and url.path == "/account":
+                out = self._account_dict()
+            elif method == "GET" and url.path == "/depth":
+                out = self.sim.depth(query['sym'], int(query.get('n', DEPTH)))
+            elif method == "POST" and url.path in ("/order", "/close", "/cancel_all"):
+                fn = {'/order': self._order, '/close': self._close, '/cancel_all': self._cancel_all}[url.path]
+                out = await self._run_op(fn, body)
+                if out['type'] == 'error':
+                    status = "400 Bad Request"
+            else:
+                status, out = "404 Not Found", {'type': 'error', 'message': f"No route {method} {url.path}"}
+        except (KeyError, ValueError, TypeError, OverflowError) as e:
+            status, out = "400 Bad Request", {'type': 'error', 'message': str(e)}
+        if isinstance(out, str):
+            payload, ctype = out.encode(), "text/plain; version=0.0.4"
+        else:
+            payload, ctype = dumps(out), "application/json"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(payload)}\r\n"
+                     f"Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n".encode() + payload)
+        await writer.drain()
+
+    async def _websocket(self, reader, writer, headers):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        # a small kernel buffer makes a slow reader show up as backpressure (and get conflated)
+        # instead of hiding seconds of stale data in the socket
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SNDBUF)
+        writer.transport.set_write_buffer_limits(SNDBUF)
+        self.next_id += 1
+        client = Client(self.next_id, writer, self.tape)
+        self.clients[client.id] = client
+        try:
+            while True:
+                try:
+                    op, data = await read_message(reader)
+                except ValueError:
+                    client.reply(ws_frame(struct.pack("!H", 1009), 0x8))
+                    break
+                if op == 0x8:
+                    client.reply(ws_frame(data[:2], 0x8))
+                    break
+                if op == 0x9:
+                    client.reply(ws_frame(data, 0xA))
+                elif op == 0x1:
+                    client.reply(ws_frame(dumps(await self._message(client, data))))
+                client.flush()
+        finally:
+            self._unsubscribe(client, list(client.subs))
+            del self.clients[client.id]
+            client.blocked = False
+            client.flush()
+            client.closed = True
+            try:
+                await asyncio.wait_for(writer.drain(), 1)
+            except (ConnectionError, asyncio.TimeoutError):
+                pass
+
+    async def _message(self, client, data):
+        msg = {}
+        try:
+            msg = json.loads(data)
+            if not isinstance(msg, dict):
+                msg = {}
+                raise ValueError("Expected a JSON object")
+            op = msg.get('op')
+            if op == 'subscribe':
+                self._subscribe(client, msg['channel'], msg.get('symbols', '*'), msg.get('tf'))
+                out = {'type': 'subscribed', 'channel': msg['channel'], 'symbols': msg.get('symbols', '*')}
+            elif op == 'unsubscribe':
+                channel = msg['channel'] if msg['channel'] != 'candles' else f"candles:{int(msg.get('tf') or 5)}"
+                syms = msg.get('symbols', '*')
+                keys = [k for k in client.subs if k[0] == channel and (syms == '*' or k[1] in syms)]
+                self._unsubscribe(client, keys)
+                out = {'type': 'unsubscribed', 'channel': msg['channel'], 'count': len(keys)}
+            elif op in ('order', 'close', 'cancel_all'):
+                fn = {'order': self._order, 'close': self._close, 'cancel_all': self._cancel_all}[op]
+                return await self._run_op(fn, msg)
+            elif op == 'ping':
+                out = {'type': 'pong', 'ts': time.time()}
+            else:
+                raise ValueError(f"Unknown op {op}")
+        except (KeyError, ValueError, TypeError, OverflowError) as e:
+            out = {'type': 'error', 'message': str(e) if not isinstance(e, KeyError) else f"Missing field {e}"}
+        if 'ref' in msg:
+            out['ref'] = msg['ref']
+        return out
+
+    # --- lifecycle ----------------------------------------------------------
+
+    async def serve(self, ready=None):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+        self.port = self.server.sockets[0].getsockname()[1]
+        pump = asyncio.create_task(self._pump())
+        if ready is not None:
+            ready()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            pump.cancel()
+
+    def start_thread(self):
+        """Run the gateway on its own event loop in a daemon thread; returns once it is listening."""
+        started = threading.Event()
+        threading.Thread(target=lambda: asyncio.run(self.serve(started.set)), name="gateway", daemon=True).start()
+        started.wait()
+        return self
+
+    def stats(self):
+        clients = list(self.clients.values())
+        return {'clients': len(clients), 'subscriptions': sum(len(s) for s in self.subs.values()),
+                'frames': self.frames, 'fanout': self.fanout, 'errors': self.errors, 'pump_ms': self.pump_ms,
+                'sent': sum(c.sent for c in clients), 'conflated': sum(c.conflated for c in clients),
+                'dropped': sum(c.dropped for c in clients), 'feed': self.feed.stats()}
+
+
+# --- standalone server and load generator -------------------------------------
+
+
+def _serve(port, symbols, rate, workers, fps, ready):
+    from portfolio import Portfolio
+    from shard import ShardedMarket
+    from simulator import MarketSimulator, make_symbols
+
+    syms = make_symbols(symbols)
+    sim = ShardedMarket(syms, workers, interval=1 / rate) if workers else MarketSimulator(syms)
+    portfolio = Portfolio(sim.symbols, cash=10000.0, leverage=1000)
+    sim.attach(portfolio)
+
+    def feed():
+        if workers:
+            return sim.run()
+        period, nxt = 1 / rate, time.perf_counter()
+        while True:
+            sim.publish_batch(sim.step(1, now=time.time()))
+            nxt += period
+            time.sleep(max(0.0, nxt - time.perf_counter()))
+
+    threading.Thread(target=feed, daemon=True).start()
+    gw = Gateway(sim, portfolio, port=port, fps=fps)
+    asyncio.run(gw.serve(lambda: ready.put(gw.port)))
+
+
+async def ws_connect(host, port, path="/"):
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_MESSAGE)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    head = await reader.readuntil(b"\r\n\r\n")
+    if b" 101 " not in head.split(b"\r\n", 1)[0]:
+        raise ConnectionError(head.decode("latin-1"))
+    return reader, writer
+
+
+def ws_send(writer, obj):
+    writer.write(ws_frame(dumps(obj), mask=os.urandom(4)))
+
+
+async def _load_client(host, port, plan, seconds, out, sample, orders):
+    try:
+        reader, writer = await ws_connect(host, port)
+    except OSError:
+        out['failed'] += 1
+        return
+    out['connected'] += 1
+    for msg in plan:
+        ws_send(writer, msg)
+    sent = {}
+
+    def on_message(data):
+        out['messages'] += 1
+        out['bytes'] += len(data)
+        if out['messages'] % sample == 0 or b'"ref"' in data:
+            msg = json.loads(data)
+            if 'ts' in msg:
+                out['latency'].append(time.time() - msg['ts'])
+            if msg.get('ref') in sent:
+                out['order_rtt'].append(time.perf_counter() - sent.pop(msg['ref']))
+
+    async def read():
+        # parse whole reads at once; one await per frame would make the load generator the bottleneck
+        buf = b""
+        while True:
+            chunk = await reader.read(1 << 16)
+            if not chunk:
+                raise ConnectionError("server closed the connection")
+            buf += chunk
+            pos, end = 0, len(buf)
+            while end - pos >= 2:
+                n, head = buf[pos + 1] & 0x7F, 2
+                if n == 126:
+                    n, head = int.from_bytes(buf[pos + 2:pos + 4], "big"), 4
+                elif n == 127:
+                    n, head = int.from_bytes(buf[pos + 2:pos + 10], "big"), 10
+                if end - pos < head + n:
+                    break
+                on_message(buf[pos + head:pos + head + n])
+                pos += head + n
+            buf = buf[pos:]
+
+    async def trade():
+        for ref in range(int(seconds * orders)):
+            await asyncio.sleep(1 / orders)
+            sent[ref] = time.perf_counter()
+            ws_send(writer, {'op': 'order', 'sym': plan[0]['symbols'][0], 'side': 'buy' if ref % 2 else 'sell',
+                             'qty': 1, 'ref': ref})
+
+    tasks = [asyncio.create_task(read())] + ([asyncio.create_task(trade())] if orders else [])
+    done, _ = await asyncio.wait(tasks, timeout=seconds, return_when=asyncio.FIRST_EXCEPTION)
+    if any(t.exception() for t in done if not t.cancelled()):
+        out['disconnected'] += 1
+    for t in tasks:
+        t.cancel()
+    writer.close()
+
+
+def _load_process(host, port, clients, symbols, seconds, sample, orders, offset, results):
+    async def go():
+        out = {'connected': 0, 'failed': 0, 'disconnected': 0, 'messages': 0, 'bytes': 0,
+               'latency': [], 'order_rtt': []}
+        tasks = []
+        for j in range(clients):
+            k = offset + j
+            sym = symbols[k % len(symbols)]
+            plan = [{'op': 'subscribe', 'channel': 'ticks', 'symbols': [sym]},
+                    {'op': 'subscribe', 'channel': 'dom', 'symbols': [sym]},
+                    {'op': 'subscribe', 'channel': 'candles', 'symbols': [sym], 'tf': 5}]
+            if k % 10 == 0:
+                plan.append({'op': 'subscribe', 'channel': 'trades', 'symbols': '*'})
+            tasks.append(_load_client(host, port, plan, seconds, out, sample, orders if k == 0 else 0))
+        await asyncio.gather(*tasks)
+        return out
+    results.put(asyncio.run(go()))
+
+
+def _http_get(host, port, path):
+    from urllib.request import urlopen
+    with urlopen(f"http://{host}:{port}{path}", timeout=10) as r:
+        return json.loads(r.read())
+
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))] * 1000 if xs else float('nan')
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="WebSocket/HTTP market-data and order gateway")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    srv = sub.add_parser("serve", help="run a simulator behind the gateway")
+    bench = sub.add_parser("bench", help="start a server and hammer it with local WebSocket clients")
+    for p in (srv, bench):
+        p.add_argument("--port", type=int, default=8765 if p is srv else 0)
+        p.add_argument("--symbols", type=int, default=10)
+        p.add_argument("--rate", type=float, default=50, help="simulation steps per second")
+        p.add_argument("--workers", type=int, default=0, help="shard the simulator over worker processes")
+        p.add_argument("--fps", type=int, default=20, help="gateway frames per second")
+    bench.add_argument("--clients", type=int, default=1000)
+    bench.add_argument("--procs", type=int, default=1, help="load-generator processes")
+    bench.add_argument("--seconds", type=float, default=10)
+    bench.add_argument("--sample", type=int, default=20, help="decode every Nth message for latency")
+    bench.add_argument("--orders", type=float, default=5, help="orders per second from one client")
+    args = ap.parse_args(argv)
+
+    ctx = get_context("spawn")
+    ready = ctx.Queue()
+    if args.cmd == "serve":
+        _serve(args.port, args.symbols, args.rate, args.workers, args.fps, ready)
+        return
+
+    server = ctx.Process(target=_serve, args=(args.port, args.symbols, args.rate, args.workers, args.fps, ready),
+                         daemon=True)
+    server.start()
+    port = ready.get(timeout=60)
+    symbols = _http_get("127.0.0.1", port, "/symbols")['symbols']
+    results = ctx.Queue()
+    per = -(-args.clients // args.procs)
+    procs = []
+    for j in range(args.procs):
+        n = min(per, args.clients - j * per)
+        p = ctx.Process(target=_load_process, args=("127.0.0.1", port, n, symbols, args.seconds, args.sample,
+                                                     args.orders, j * per, results))
+        p.start()
+        procs.append(p)
+    parts = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    stats = _http_get("127.0.0.1", port, "/stats")
+    server.terminate()
+
+    total = {k: sum(p[k] for p in parts) for k in ('connected', 'failed', 'disconnected', 'messages', 'bytes')}
+    lat = [x for p in parts for x in p['latency']]
+    rtt = [x for p in parts for x in p['order_rtt']]
+    print(f"{total['connected']:,}/{args.clients:,} clients connected ({total['failed']} failed, "
+          f"{total['disconnected']} dropped) over {args.seconds:.0f}s, {len(symbols)} symbols")
+    print(f"  received {total['messages'] / args.seconds:,.0f} msgs/s, {total['bytes'] / args.seconds / 2**20:,.1f} MiB/s")
+    print(f"  tick-to-client latency p50 {_pct(lat, 0.5):.1f} ms  p99 {_pct(lat, 0.99):.1f} ms  ({len(lat):,} samples)")
+    print(f"  order round trip p50 {_pct(rtt, 0.5):.1f} ms  p99 {_pct(rtt, 0.99):.1f} ms  ({len(rtt)} orders)")
+    print(f"  server: {stats['frames']:,} frames built, {stats['fanout']:,} deliveries, "
+          f"{stats['conflated']:,} conflated, {stats['dropped']:,} tape drops, pump {stats['pump_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
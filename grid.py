@@ -0,0 +1,137 @@
+from collections import deque
+
+
+class TreeGrid:
+    """Keeps a ttk.Treeview in sync with a list of rows.
+
+    Rows are (values, tags) and are matched to existing items by position.
+    Only cells whose text changed are written; items are inserted or deleted
+    only when the row count changes.
+    """
+
+    def __init__(self, tree, columns):
+        self.tree = tree
+        self.columns = columns
+        self.iids = []
+        self.rows = []
+        self.cells_written = 0
+
+    def update(self, rows):
+        tree = self.tree
+        for j, (values, tags) in enumerate(rows):
+            values = tuple(values)
+            tags = tuple(tags)
+            if j == len(self.iids):
+                self.iids.append(tree.insert("", "end", values=values, tags=tags))
+                self.rows.append((values, tags))
+                self.cells_written += len(values)
+                continue
+            old_values, old_tags = self.rows[j]
+            if old_values == values and old_tags == tags:
+                continue
+            iid = self.iids[j]
+            for col, old, new in zip(self.columns, old_values, values):
+                if old != new:
+                    tree.set(iid, col, new)
+                    self.cells_written += 1
+            if old_tags != tags:
+                tree.item(iid, tags=tags)
+            self.rows[j] = (values, tags)
+        if len(rows) < len(self.iids):
+            tree.delete(*self.iids[len(rows):])
+            del self.iids[len(rows):]
+            del self.rows[len(rows):]
+
+
+class VirtualList:
+    """Bounded, newest-first history shown through a Listbox that only holds the visible rows.
+
+    History is a ring buffer of (text, color). The Listbox holds at most `rows`
+    lines; scrolling moves a window over the buffer instead of asking Tk to
+    keep every line. While the view is at the top, new lines are inserted
+    and the same number drop off the bottom. When scrolled back, the window
+    stays put.
+    """
+
+    def __init__(self, listbox, scrollbar=None, capacity=5000, rows=12):
+        self.listbox = listbox
+        self.scrollbar = scrollbar
+        self.rows = rows
+        self.items = deque(maxlen=capacity)
+        self.seq = 0
+        self.offset = 0
+        self.shown = []
+        listbox.bind("<MouseWheel>", lambda e: self._wheel(-1 if e.delta > 0 else 1))
+        listbox.bind("<Button-4>", lambda e: self._wheel(-1))
+        listbox.bind("<Button-5>", lambda e: self._wheel(1))
+        if scrollbar is not None:
+            scrollbar.configure(command=self.yview)
+
+    def extend(self, lines):
+        for text, color in lines:
+            self.seq += 1
+            self.items.append((self.seq, text, color))
+        if self.offset:
+            self.offset = min(self.offset + len(lines), self._max_offset())
+        self.render()
+
+    def _max_offset(self):
+        return max(0, len(self.items) - self.rows)
+
+    def _window(self):
+        n = len(self.items)
+        top = n - 1 - self.offset
+        return [self.items[j] for j in range(top, max(-1, top - self.rows), -1)]
+
+    def render(self):
+        want = self._window()
+        shown = self.shown
+        lb = self.listbox
+        if want != shown:
+            k = want[0][0] - shown[0][0] if want and shown else -1
+            if 0 < k < self.rows and want[k:] == shown[:len(want) - k]:
+                for j in range(k - 1, -1, -1):
+                    lb.insert(0, want[j][1])
+                    lb.itemconfig(0, fg=want[j][2])
+                if len(shown) + k > self.rows:
+                    lb.delete(self.rows, "end")
+            else:
+                lb.delete(0, "end")
+                for j, (_, text, color) in enumerate(want):
+                    lb.insert("end", text)
+                    lb.itemconfig(j, fg=color)
+            self.shown = want
+        if self.scrollbar is not None:
+            n = max(1, len(self.items))
+            self.scrollbar.set(self.offset / n, min(1.0, (self.offset + self.rows) / n))
+
+    def _wheel(self, units):
+        self.scroll(units * 3)
+        return "break"
+
+    def scroll(self, rows):
+        self.offset = min(max(0, self.offset + rows), self._max_offset())
+        self.render()
+
+    def yview(self, *args):
+        if args[0] == "moveto":
+            self.offset = min(max(0, int(float(args[1]) * len(self.items))), self._max_offset())
+            self.render()
+        elif args[0] == "scroll":
+            self.scroll(int(args[1]) * (self.rows if args[2] == "pages" else 1))
+
+
+def dom_rows(book):
+    """DOM grid rows (price, size, cumulative size) for a depth() snapshot."""
+    rows = []
+    for side, tag in (('bids', 'bid'), ('asks', 'ask')):
+        cum = 0
+        for p, s, user in book[side]:
+            cum += s
+            rows.append(((f"{p:.3f}", f"{s:,}", f"{cum:,}"), ("user" if user else tag,)))
+    return rows
+
+
+def position_rows(positions):
+    return [((sym, f"{p['size']:,}", f"{p['avg_price']:.3f}", f"{p['unreal']:+,.0f}", "X"), ())
+            for sym, p in positions.items()]
@@ -0,0 +1,376 @@
+import re
+
+import numpy as np
+
+DAY = 86400
+
+
+def ewm(x, alpha, y0):
+    """y[t] = y[t-1] + alpha * (x[t] - y[t-1]) down axis 0, starting from y0, without a Python loop per row.
+
+    Uses the closed form y[t] = beta**t * (y0 + alpha * sum(beta**-k * x[k])),
+    in blocks short enough that beta**-k stays far from overflow.
+    """
+    out = np.empty(x.shape)
+    beta = 1.0 - alpha
+    if beta <= 0:
+        out[:] = x
+        return out
+    step = max(1, int(230 / -np.log(beta))) if beta < 1 else len(x)
+    y = np.asarray(y0, dtype=float)
+    for a in range(0, len(x), step):
+        blk = x[a:a + step]
+        k = np.arange(1, len(blk) + 1).reshape((-1,) + (1,) * (x.ndim - 1))
+        out[a:a + len(blk)] = beta ** k * (y + alpha * np.cumsum(beta ** -k * blk, axis=0))
+        y = out[a + len(blk) - 1]
+    return out
+
+
+def _wilder(acc, x, d, n):
+    """Wilder's average after its d-th input: a plain sum while warming up, seeded with the mean at d == n."""
+    if d < n:
+        return acc + x
+    if d == n:
+        return (acc + x) / n
+    return acc + (x - acc) / n
+
+
+def _wilder_fill(x, n):
+    """Wilder averages after every row of x (NaN before the n-th) and the accumulator after the last."""
+    out = np.full(x.shape, np.nan)
+    if len(x) < n:
+        return out, x.sum(axis=0)
+    out[n - 1] = x[:n].mean(axis=0)
+    out[n:] = ewm(x[n:], 1.0 / n, out[n - 1])
+    return out, out[-1].copy()
+
+
+class Indicator:
+    """A study computed alongside one candle timeframe for every symbol.
+
+    Outputs are ring buffers laid out exactly like the candle frame's, with
+    rows as bars, columns as symbols and every row mirrored, so the same
+    window slice gives zero-copy views aligned with CandleStore.view.
+    close() runs once per finished bar and commits the running state for
+    all symbols at once. live() derives the forming bar from that state
+    without committing, so either one is O(1) per symbol. backfill() covers
+    the bars already in the frame with whole-array operations.
+    """
+
+    outputs = ('value',)
+
+    def __init__(self, n=None):
+        self.n = n
+        self.f = None
+        self.k = 0  # bars closed so far, counted from the oldest retained bar at bind time
+
+    @property
+    def name(self):
+        return f"{type(self).__name__.lower()}{self.n or ''}"
+
+    def bind(self, frame):
+        self.f = frame
+        shape = frame.close.shape
+        self.out = {name: np.full(shape, np.nan) for name in self.outputs}
+        self.reset(shape[1])
+        w = frame.window()
+        m = w.stop - w.start - 1
+        if m > 0:
+            rows = np.arange(w.start, w.stop - 1)
+            self.backfill(rows, m)
+            self.k = m
+
+    def _put(self, s, cols, **values):
+        for name, v in values.items():
+            a = self.out[name]
+            a[s, cols] = v
+            a[s + self.f.capacity, cols] = v
+
+    def _fill(self, rows, **values):
+        mirror = (rows + self.f.capacity) % (2 * self.f.capacity)
+        for name, v in values.items():
+            self.out[name][rows] = v
+            self.out[name][mirror] = v
+
+    def close(self, s):
+        self.step(s, slice(None), True)
+        self.k += 1
+
+    def live(self, s, cols):
+        self.step(s, cols, False)
+
+    def reset(self, n_symbols):
+        raise NotImplementedError
+
+    def step(self, s, cols, commit):
+        raise NotImplementedError
+
+    def backfill(self, rows, m):
+        raise NotImplementedError
+
+
+class SMA(Indicator):
+    """Simple moving average of closes, from a running sum of the previous n-1 closes.
+
+    The sum is taken afresh from the window every n bars, which keeps updates
+    O(1) amortized and stops float error from piling up.
+    """
+
+    def reset(self, n_symbols):
+        self.sum = np.zeros(n_symbols)
+
+    def bind(self, frame):
+        if self.n >= frame.capacity:
+            raise ValueError(f"{self.name} needs more than the {frame.capacity} bars retained")
+        super().bind(frame)
+
+    def _recent(self, s, n):
+        """Closes of the n bars ending at slot s, read through the mirrored rows."""
+        cap = self.f.capacity
+        return self.f.close[s + cap - n + 1:s + cap + 1]
+
+    def _windows(self, rows):
+        """(bars - n + 1, symbols, n) sliding windows over the closes at rows."""
+        return np.lib.stride_tricks.sliding_window_view(self.f.close[rows], self.n, axis=0)
+
+    def step(self, s, cols, commit):
+        f, n, k = self.f, self.n, self.k
+        total = self.sum[cols] + f.close[s, cols]
+        self._put(s, cols, value=total / n if k >= n - 1 else np.nan)
+        if commit:
+            if (k + 1) % n == 0:
+                self.sum = self._recent(s, n - 1).sum(axis=0)
+            elif k >= n - 1:
+                self.sum = total - f.close[s + f.capacity - n + 1]
+            else:
+                self.sum = total
+
+    def backfill(self, rows, m):
+        value = np.full((m, len(self.sum)), np.nan)
+        if m >= self.n:
+            value[self.n - 1:] = self._windows(rows).mean(axis=-1)
+        self._fill(rows, value=value)
+        self.sum = self._recent(rows[-1] % self.f.capacity, min(self.n - 1, m)).sum(axis=0)
+
+
+class Bollinger(SMA):
+    """SMA middle band with bands k population standard deviations either side.
+
+    Sums are kept relative to a recent close, re-anchored every n bars, so the
+    variance doesn't cancel away when prices are large next to their spread.
+    """
+
+    outputs = ('mid', 'upper', 'lower')
+
+    def __init__(self, n=20, k=2.0):
+        super().__init__(n)
+        self.width = k
+
+    @property
+    def name(self):
+        return f"bb{self.n}"
+
+    def reset(self, n_symbols):
+        self.ref = np.zeros(n_symbols)
+        self.sum = np.zeros(n_symbols)
+        self.sumsq = np.zeros(n_symbols)
+
+    def _anchor(self, s, n, cols, ref):
+        recent = self._recent(s, n)[:, cols] - ref
+        self.ref[cols], self.sum[cols], self.sumsq[cols] = ref, recent.sum(axis=0), (recent * recent).sum(axis=0)
+
+    def step(self, s, cols, commit):
+        f, n, k = self.f, self.n, self.k
+        c = f.close[s, cols]
+        d = c - self.ref[cols]
+        total, totalsq = self.sum[cols] + d, self.sumsq[cols] + d * d
+        if k >= n - 1:
+            mean = total / n
+            sd = np.sqrt(np.maximum(totalsq / n - mean * mean, 0.0))
+            mid = self.ref[cols] + mean
+            self._put(s, cols, mid=mid, upper=mid + self.width * sd, lower=mid - self.width * sd)
+        else:
+            self._put(s, cols, mid=np.nan, upper=np.nan, lower=np.nan)
+        if commit:
+            if k >= n - 1:
+                old = f.close[s + f.capacity - n + 1] - self.ref
+                self.sum, self.sumsq = total - old, totalsq - old * old
+                far = np.maximum(np.abs(d), np.abs(old))
+            else:
+                self.sum, self.sumsq = total, totalsq
+                far = np.abs(d)
+            if (k + 1) % n == 0:
+                self._anchor(s, n - 1, slice(None), c.copy())
+            else:
+                # a close far from the anchor entering or leaving would cancel badly; resum just those symbols
+                far = np.flatnonzero(far > np.abs(self.ref))
+                if len(far):
+                    self._anchor(s, min(n - 1, k + 1), far, c[far])
+
+    def backfill(self, rows, m):
+        n = self.n
+        bands = [np.full((m, len(self.sum)), np.nan) for _ in range(3)]
+        if m >= n:
+            win = self._windows(rows)
+            mid, sd = win.mean(axis=-1), win.std(axis=-1)
+            for a, v in zip(bands, (mid, mid + self.width * sd, mid - self.width * sd)):
+                a[n - 1:] = v
+        self._fill(rows, mid=bands[0], upper=bands[1], lower=bands[2])
+        s = rows[-1] % self.f.capacity
+        self._anchor(s, min(n - 1, m), slice(None), self.f.close[s].copy())
+
+
+class EMA(Indicator):
+    """Exponential moving average of closes, alpha = 2 / (n + 1), seeded with the first close."""
+
+    def reset(self, n_symbols):
+        self.ema = np.zeros(n_symbols)
+
+    def step(self, s, cols, commit):
+        c = self.f.close[s, cols]
+        e = c if self.k == 0 else self.ema[cols] + 2.0 / (self.n + 1) * (c - self.ema[cols])
+        self._put(s, cols, value=e)
+        if commit:
+            self.ema = e.copy()
+
+    def backfill(self, rows, m):
+        c = self.f.close[rows]
+        value = np.empty(c.shape)
+        value[0] = c[0]
+        value[1:] = ewm(c[1:], 2.0 / (self.n + 1), c[0])
+        self._fill(rows, value=value)
+        self.ema = value[-1].copy()
+
+
+class RSI(Indicator):
+    """Wilder's relative strength index over n close-to-close changes."""
+
+    def reset(self, n_symbols):
+        self.prev = np.zeros(n_symbols)
+        self.gain = np.zeros(n_symbols)
+        self.loss = np.zeros(n_symbols)
+
+    @staticmethod
+    def _rsi(gain, loss):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = 100.0 - 100.0 / (1.0 + gain / loss)
+        return np.where(loss > 0, rsi, np.where(gain > 0, 100.0, 50.0))
+
+    def step(self, s, cols, commit):
+        n, d = self.n, self.k  # d: changes up to and including this bar
+        c = self.f.close[s, cols]
+        if d == 0:
+            gain, loss = self.gain[cols], self.loss[cols]
+        else:
+            delta = c - self.prev[cols]
+            gain = _wilder(self.gain[cols], np.maximum(delta, 0.0), d, n)
+            loss = _wilder(self.loss[cols], np.maximum(-delta, 0.0), d, n)
+        self._put(s, cols, value=self._rsi(gain, loss) if d >= n else np.nan)
+        if commit:
+            self.prev, self.gain, self.loss = c.copy(), gain, loss
+
+    def backfill(self, rows, m):
+        c = self.f.close[rows]
+        delta = np.diff(c, axis=0)
+        gain, self.gain = _wilder_fill(np.maximum(delta, 0.0), self.n)
+        loss, self.loss = _wilder_fill(np.maximum(-delta, 0.0), self.n)
+        value = np.full(c.shape, np.nan)
+        value[1:] = np.where(np.isnan(gain), np.nan, self._rsi(gain, loss))
+        self._fill(rows, value=value)
+        self.prev = c[-1].copy()
+
+
+class ATR(Indicator):
+    """Wilder's average true range; the first bar's true range is its high-low range."""
+
+    def reset(self, n_symbols):
+        self.prev = np.zeros(n_symbols)
+        self.atr = np.zeros(n_symbols)
+
+    @staticmethod
+    def _true_range(h, l, pc):
+        return np.maximum(h - l, np.maximum(np.abs(h - pc), np.abs(l - pc)))
+
+    def step(self, s, cols, commit):
+        f, n, k = self.f, self.n, self.k
+        h, l, c = f.high[s, cols], f.low[s, cols], f.close[s, cols]
+        tr = h - l if k == 0 else self._true_range(h, l, self.prev[cols])
+        atr = _wilder(self.atr[cols], tr, k + 1, n)
+        self._put(s, cols, value=atr if k + 1 >= n else np.nan)
+        if commit:
+            self.prev, self.atr = c.copy(), atr
+
+    def backfill(self, rows, m):
+        f = self.f
+        h, l, c = f.high[rows], f.low[rows], f.close[rows]
+        tr = h - l
+        tr[1:] = self._true_range(h[1:], l[1:], c[:-1])
+        value, self.atr = _wilder_fill(tr, self.n)
+        self._fill(rows, value=value)
+        self.prev = c[-1].copy()
+
+
+class VWAP(Indicator):
+    """Volume-weighted average of the typical price (h+l+c)/3, restarting each UTC day.
+
+    Before any volume has traded in the session it shows the typical price.
+    """
+
+    def reset(self, n_symbols):
+        self.day = None
+        self.pv = np.zeros(n_symbols)
+        self.vol = np.zeros(n_symbols)
+
+    @staticmethod
+    def _vwap(pv, vol, tp):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(vol > 0, pv / vol, tp)
+
+    def step(self, s, cols, commit):
+        f = self.f
+        tp = (f.high[s, cols] + f.low[s, cols] + f.close[s, cols]) / 3.0
+        v = f.volume[s, cols]
+        day = int(f.time[s]) // DAY
+        if day == self.day:
+            pv, vol = self.pv[cols] + tp * v, self.vol[cols] + v
+        else:
+            pv, vol = tp * v, v.astype(float)
+        self._put(s, cols, value=self._vwap(pv, vol, tp))
+        if commit:
+            self.day, self.pv, self.vol = day, pv, vol
+
+    def backfill(self, rows, m):
+        f = self.f
+        tp = (f.high[rows] + f.low[rows] + f.close[rows]) / 3.0
+        v = f.volume[rows].astype(float)
+        days = f.time[rows] // DAY
+        starts = np.concatenate(([0], np.flatnonzero(days[1:] != days[:-1]) + 1))
+        first = np.repeat(starts, np.diff(np.append(starts, m)))
+        cpv = np.cumsum(tp * v, axis=0)
+        cv = np.cumsum(v, axis=0)
+        # cumulative sums up to each row, minus everything before its session started
+        base_pv = np.where((first > 0)[:, None], cpv[first - 1], 0.0)
+        base_v = np.where((first > 0)[:, None], cv[first - 1], 0.0)
+        pv, vol = cpv - base_pv, cv - base_v
+        self._fill(rows, value=self._vwap(pv, vol, tp))
+        self.day, self.pv, self.vol = int(days[-1]), pv[-1].copy(), vol[-1].copy()
+
+
+KINDS = {'sma': SMA, 'ema': EMA, 'bb': Bollinger, 'rsi': RSI, 'atr': ATR, 'vwap': VWAP}
+DEFAULTS = {'sma': 20, 'ema': 20, 'bb': 20, 'rsi': 14, 'atr': 14, 'vwap': None}
+
+
+def make(spec):
+    """Build an indicator from a spec like 'sma20', 'ema50', 'bb20', 'rsi14', 'atr14' or 'vwap'."""
+    m = re.fullmatch(r"([a-z]+)(\d*)", spec.lower())
+    if m is None or m.group(1) not in KINDS:
+        raise ValueError(f"Unknown indicator {spec}")
+    kind, n = m.group(1), m.group(2)
+    if kind == 'vwap':
+        if n:
+            raise ValueError("vwap takes no period")
+        return VWAP()
+    n = int(n) if n else DEFAULTS[kind]
+    if n < 1:
+        raise ValueError("Indicator period must be positive")
+    return KINDS[kind](n)
@@ -0,0 +1,123 @@
+import argparse
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from orderbook import TICK, OrderBook, to_ticks
+
+Fill = namedtuple("Fill", "price qty maker_id maker_owner")
+Execution = namedtuple("Execution", "order_id side requested filled vwap fills resting")
+
+TIFS = ('GTC', 'IOC', 'FOK')
+
+
+class MatchingEngine:
+    """Price-time priority matching against an OrderBook.
+
+    Market orders (price=None) walk the opposite side until filled or the book
+    runs out of levels priced above zero; whatever is left is cancelled. Limit
+    orders take liquidity up to their price and then, depending on time in
+    force, rest (GTC), cancel the remainder (IOC), or only trade if the whole
+    quantity can fill (FOK).
+    """
+
+    def __init__(self):
+        self.orders = 0
+        self.fills = 0
+
+    def submit(self, book, side, qty, price=None, tif='GTC', owner=None):
+        if qty <= 0:
+            raise ValueError("Quantity must be positive")
+        if tif not in TIFS:
+            raise ValueError(f"Unknown time in force {tif}")
+        limit = None if price is None else to_ticks(price)
+        if limit is not None and limit <= 0:
+            raise ValueError("Price must be positive")
+        self.orders += 1
+        opp = 'sell' if side == 'buy' else 'buy'
+        buy = side == 'buy'
+        oid = next(book.ids)
+
+        if tif == 'FOK':
+            avail = 0
+            for lvl in book.levels(opp):
+                if avail >= qty or lvl.ticks <= 0 or (limit is not None and (lvl.ticks > limit if buy else lvl.ticks < limit)):
+                    break
+                avail += lvl.qty
+            if avail < qty:
+                return Execution(oid, side, qty, 0, None, [], None)
+
+        fills = []
+        left = qty
+        notional = 0.0
+        while left:
+            lvl = book.best(opp)
+            if lvl is None or lvl.ticks <= 0 or (limit is not None and (lvl.ticks > limit if buy else lvl.ticks < limit)):
+                break
+            px = round(lvl.ticks * TICK, 3)
+            for o in list(lvl.orders.values()):
+                q = min(left, o.qty)
+                fills.append(Fill(px, q, o.id, o.owner))
+                notional += px * q
+                left -= q
+                book.fill(o, q)
+                if not left:
+                    break
+
+        resting = None
+        if left and limit is not None and tif == 'GTC':
+            resting = book.add(side, price, left, owner, oid)
+        filled = qty - left
+        self.fills += len(fills)
+        return Execution(oid, side, qty, filled, notional / filled if filled else None, fills, resting)
+
+
+def bench(n_orders=200000, seed=0, levels=40):
+    """Random order flow against one book: resting limits, market/IOC/FOK takers and cancels."""
+    rng = np.random.default_rng(seed)
+    book = OrderBook("BENCH")
+    engine = MatchingEngine()
+    mid = 100.0
+    for j in range(levels):
+        book.add('buy', mid - 0.01 * (j + 1), 500, 'mm')
+        book.add('sell', mid + 0.01 * (j + 1), 500, 'mm')
+
+    kind = rng.random(n_orders).tolist()
+    sides = np.where(rng.random(n_orders) < 0.5, 'buy', 'sell').tolist()
+    qtys = rng.integers(1, 1000, n_orders).tolist()
+    prices = np.round(mid + rng.integers(-levels, levels, n_orders) * 0.01, 2).tolist()
+    live = []
+    filled = 0
+    t0 = time.perf_counter()
+    for k in range(n_orders):
+        side = sides[k]
+        if kind[k] < 0.55:
+            ex = engine.submit(book, side, qtys[k], prices[k])
+            if ex.resting is not None:
+                live.append(ex.resting.id)
+        elif kind[k] < 0.75 and live:
+            book.cancel(live.pop(qtys[k] % len(live)))
+            continue
+        elif kind[k] < 0.9:
+            ex = engine.submit(book, side, qtys[k])
+        else:
+            ex = engine.submit(book, side, qtys[k], prices[k], tif='IOC' if kind[k] < 0.95 else 'FOK')
+        filled += ex.filled
+    elapsed = time.perf_counter() - t0
+    return {'orders': n_orders, 'seconds': elapsed, 'orders_per_sec': n_orders / elapsed,
+            'fills': engine.fills, 'filled_qty': filled, 'resting': len(book.orders)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Headless matching engine benchmark")
+    ap.add_argument("--orders", type=int, default=200000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+    r = bench(args.orders, args.seed)
+    print(f"{r['orders']:,} orders in {r['seconds']:.3f}s ({r['orders_per_sec']:,.0f} orders/s), "
+          f"{r['fills']:,} fills, {r['resting']:,} resting")
+
+
+if __name__ == "__main__":
+    main()
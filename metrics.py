@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import threading
+import time
+from time import perf_counter_ns
+
+SUB = 4                      # buckets per power of two, ~19% wide
+BUCKETS = 64 * SUB           # any 64-bit ns duration
+PROM_LADDER = range(10, 37)  # exported bucket bounds, 2**e ns
+
+
+def bucket(ns):
+    if ns < 8:
+        return max(ns, 0)
+    e = ns.bit_length()
+    return (e << 2) | ((ns >> (e - 3)) & 3)
+
+
+def upper(b):
+    """Exclusive upper bound of bucket b, in ns."""
+    if b < 8:
+        return b + 1
+    return (5 + (b & 3)) << ((b >> 2) - 3)
+
+
+class Span:
+    """Latency histogram for one code path, usable as a context manager.
+
+    Counts live in a list allocated up front with log-linear buckets, so
+    recording is a bit_length and a list increment with no allocation. A
+    span is meant to be timed from a single thread; readers on other threads
+    see a slightly stale but consistent-enough view.
+    """
+
+    __slots__ = ('name', 'counts', 'count', 'total', 'max', '_t0')
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self._t0 = 0
+
+    def __enter__(self):
+        self._t0 = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.record(perf_counter_ns() - self._t0)
+
+    def record(self, ns):
+        self.counts[bucket(ns)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile, in ns."""
+        if not self.count:
+            return 0
+        rank = self.count * q / 100.0
+        seen = 0
+        for b, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(upper(b), self.max)
+        return self.max
+
+    def reset(self):
+        self.counts[:] = [0] * BUCKETS
+        self.count = self.total = self.max = 0
+
+    def summary(self):
+        n = self.count
+        return {'count': n, 'mean_us': self.total / n / 1000 if n else 0.0,
+                'p50_us': self.percentile(50) / 1000, 'p99_us': self.percentile(99) / 1000,
+                'max_us': self.max / 1000}
+
+
+class Counter:
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+class Metrics:
+    """Named spans, counters and gauges.
+
+    Counters and gauges can also be callables that read state the code
+    already keeps (a queue's depth, a drop count), so instrumenting them
+    costs nothing until someone looks.
+    """
+
+    def __init__(self):
+        self.spans = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        s = self.spans.get(name)
+        if s is None:
+            with self._lock:
+                s = self.spans.setdefault(name, Span(name))
+        return s
+
+    def counter(self, name, fn=None):
+        if fn is not None:
+            self.counters[name] = fn
+            return fn
+        c = self.counters.get(name)
+        if c is None:
+            with self._lock:
+                c = self.counters.setdefault(name, Counter(name))
+        return c
+
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    def _read(self, table):
+        out = {}
+        for name, c in list(table.items()):
+            try:
+                out[name] = c.value if isinstance(c, Counter) else c()
+            except Exception:  # a gauge whose owner has gone away
+                continue
+        return out
+
+    def snapshot(self):
+        return {'time': time.time(),
+                'spans': {name: s.summary() for name, s in list(self.spans.items())},
+                'counters': self._read(self.counters), 'gauges': self._read(self.gauges)}
+
+    def reset(self):
+        for s in list(self.spans.values()):
+            s.reset()
+
+    def prometheus(self, prefix="nexus"):
+        """Prometheus text exposition: spans as histograms in seconds, then counters and gauges."""
+        lines = []
+        for name, s in sorted(self.spans.items()):
+            m = f"{prefix}_{_metric(name)}_seconds"
+            lines.append(f"# TYPE {m} histogram")
+            # a fixed ladder of powers of two (~1 us to ~69 s) so bucket labels are stable between scrapes
+            counts = s.counts
+            seen = sum(counts[:PROM_LADDER[0] * SUB])
+            for e in PROM_LADDER:
+                seen += sum(counts[e * SUB:(e + 1) * SUB])
+                lines.append(f'{m}_bucket{{le="{(1 << e) / 1e9:.9g}"}} {seen}')
+            lines.append(f'{m}_bucket{{le="+Inf"}} {s.count}')
+            lines.append(f"{m}_sum {s.total / 1e9:.9g}")
+            lines.append(f"{m}_count {s.count}")
+        for kind, table in (("counter", self.counters), ("gauge", self.gauges)):
+            for name, v in sorted(self._read(table).items()):
+                m = f"{prefix}_{_metric(name)}" + ("_total" if kind == "counter" else "")
+                lines.append(f"# TYPE {m} {kind}")
+                lines.append(f"{m} {v}")
+        return "\n".join(lines) + "\n"
+
+    def table(self):
+        """Fixed-width text for the on-screen overlay."""
+        rows = [f"{'span':18}{'n':>8}{'p50':>9}{'p99':>9}{'max':>9}  ms"]
+        for name, s in sorted(self.spans.items()):
+            if s.count:
+                rows.append(f"{name:18}{s.count:8d}{s.percentile(50) / 1e6:9.2f}{s.percentile(99) / 1e6:9.2f}"
+                            f"{s.max / 1e6:9.2f}")
+        for name, v in sorted({**self._read(self.counters), **self._read(self.gauges)}.items()):
+            rows.append(f"{name:18}{v:>8,.0f}" if isinstance(v, (int, float)) else f"{name:18}{v!s:>8}")
+        return "\n".join(rows)
+
+
+def _metric(name):
+    return "".join(ch if ch.isalnum() else "_" for ch in name)
+
+
+class Exporter:
+    """Writes the registry to a file every interval seconds from a daemon thread.
+
+    A .prom path is rewritten in place with the Prometheus text format (for
+    node_exporter's textfile collector); anything else gets one JSON snapshot
+    appended per line.
+    """
+
+    def __init__(self, metrics, path, interval=1.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self):
+        if self.path.endswith(".prom"):
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(self.metrics.prometheus())
+            os.replace(tmp, self.path)
+        else:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(self.metrics.snapshot()) + "\n")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+
+METRICS = Metrics()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Summarize a JSON-lines metrics export")
+    ap.add_argument("path")
+    ap.add_argument("--last", type=int, default=1, help="print the last N snapshots")
+    args = ap.parse_args(argv)
+    with open(args.path) as f:
+        snaps = [json.loads(line) for line in f if line.strip()]
+    for snap in snaps[-args.last:]:
+        print(time.strftime("%H:%M:%S", time.localtime(snap['time'])))
+        for name, s in sorted(snap['spans'].items()):
+            print(f"  {name:18} n={s['count']:<8} p50 {s['p50_us']:9.1f} us  p99 {s['p99_us']:9.1f} us  "
+                  f"max {s['max_us']:9.1f} us")
+        for name, v in sorted({**snap['counters'], **snap['gauges']}.items()):
+            print(f"  {name:18} {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import bisect
+import itertools
+
+TICK = 0.001
+
+
+def to_ticks(price):
+    return int(round(price / TICK))
+
+
+class Order:
+    __slots__ = ('id', 'side', 'ticks', 'qty', 'owner')
+
+    def __init__(self, oid, side, ticks, qty, owner):
+        self.id = oid
+        self.side = side
+        self.ticks = ticks
+        self.qty = qty
+        self.owner = owner
+
+    @property
+    def price(self):
+        return round(self.ticks * TICK, 3)
+
+    def __repr__(self):
+        return f"Order({self.id}, {self.side}, {self.price}, {self.qty}, {self.owner})"
+
+
+class Level:
+    __slots__ = ('ticks', 'orders', 'qty')
+
+    def __init__(self, ticks):
+        self.ticks = ticks
+        self.orders = {}  # dicts keep insertion order, so this is the FIFO queue
+        self.qty = 0
+
+
+class OrderBook:
+    """Price-level limit order book for one symbol.
+
+    Levels are keyed by integer ticks. Each side keeps its level keys in an
+    ascending list with the best level at the end (asks are stored negated),
+    so the best price is O(1), finding a level is a bisect, and top-N depth
+    is a slice of already sorted keys.
+    """
+
+    def __init__(self, sym, ids=None):
+        self.sym = sym
+        self.ids = ids if ids is not None else itertools.count(1)
+        self.orders = {}
+        self.version = 0
+        self._levels = {'buy': {}, 'sell': {}}
+        self._keys = {'buy': [], 'sell': []}
+        self._depth = None
+
+    @staticmethod
+    def _key(side, ticks):
+        return ticks if side == 'buy' else -ticks
+
+    def _touch(self):
+        self.version += 1
+        self._depth = None
+
+    def add(self, side, price, qty, owner=None, oid=None):
+        if qty <= 0:
+            raise ValueError("Quantity must be positive")
+        ticks = to_ticks(price)
+        if ticks <= 0:
+            raise ValueError("Price must be positive")
+        if oid is None:
+            oid = next(self.ids)
+        o = Order(oid, side, ticks, qty, owner)
+        k = self._key(side, ticks)
+        levels = self._levels[side]
+        lvl = levels.get(k)
+        if lvl is None:
+            lvl = levels[k] = Level(ticks)
+            bisect.insort(self._keys[side], k)
+        lvl.orders[oid] = o
+        lvl.qty += qty
+        self.orders[oid] = o
+        self._touch()
+        return o
+
+    def cancel(self, oid):
+        o = self.orders.pop(oid, None)
+        if o is None:
+            return None
+        k = self._key(o.side, o.ticks)
+        levels = self._levels[o.side]
+        lvl = levels[k]
+        del lvl.orders[oid]
+        lvl.qty -= o.qty
+        if not lvl.orders:
+            del levels[k]
+            keys = self._keys[o.side]
+            del keys[bisect.bisect_left(keys, k)]
+        self._touch()
+        return o
+
+    def modify(self, oid, qty=None, price=None):
+        """Change an order in place. Shrinking keeps queue priority; a new price or a bigger size loses it."""
+        o = self.orders.get(oid)
+        if o is None:
+            return None
+        qty = o.qty if qty is None else qty
+        if qty <= 0:
+            return self.cancel(oid)
+        if (price is None or to_ticks(price) == o.ticks) and qty <= o.qty:
+            self._levels[o.side][self._key(o.side, o.ticks)].qty -= o.qty - qty
+            o.qty = qty
+            self._touch()
+            return o
+        self.cancel(oid)
+        return self.add(o.side, o.price if price is None else price, qty, o.owner, oid)
+
+    def fill(self, o, qty):
+        """Take qty off a resting order (used by the matching engine)."""
+        if qty >= o.qty:
+            self.cancel(o.id)
+        else:
+            o.qty -= qty
+            self._levels[o.side][self._key(o.side, o.ticks)].qty -= qty
+            self._touch()
+
+    def best(self, side):
+        keys = self._keys[side]
+        return self._levels[side][keys[-1]] if keys else None
+
+    def best_bid(self):
+        lvl = self.best('buy')
+        return round(lvl.ticks * TICK, 3) if lvl else None
+
+    def best_ask(self):
+        lvl = self.best('sell')
+        return round(lvl.ticks * TICK, 3) if lvl else None
+
+    def level(self, side, ticks):
+        return self._levels[side].get(self._key(side, ticks))
+
+    def levels(self, side):
+        """Levels from best to worst."""
+        levels = self._levels[side]
+        keys = self._keys[side]
+        for j in range(len(keys) - 1, -1, -1):
+            yield levels[keys[j]]
+
+    def level_count(self, side):
+        return len(self._keys[side])
+
+    def pull(self, side, price, owner):
+        """Cancel owner's orders priced better than price (e.g. quotes left inside a new spread)."""
+        keys = self._keys[side]
+        levels = self._levels[side]
+        limit = self._key(side, to_ticks(price))
+        j = len(keys) - 1
+        while j >= 0 and keys[j] > limit:
+            for o in [o for o in levels[keys[j]].orders.values() if o.owner == owner]:
+                self.cancel(o.id)
+            j -= 1
+
+    def trim(self, side, max_levels, owner):
+        """Cancel owner's orders on the worst levels until at most max_levels remain."""
+        keys = self._keys[side]
+        levels = self._levels[side]
+        j = 0
+        while len(keys) > max_levels and j < len(keys):
+            lvl = levels[keys[j]]
+            mine = [o for o in lvl.orders.values() if o.owner == owner]
+            if len(mine) < len(lvl.orders):
+                j += 1
+            for o in mine:
+                self.cancel(o.id)
+
+    def depth(self, n=15):
+        """Top n levels per side as {'bids': [(price, size, user_size)], 'asks': [...]}.
+
+        The snapshot is cached until the next change to the book.
+        """
+        if self._depth is not None and self._depth[0] == n:
+            return self._depth[1]
+        out = {}
+        for side, name in (('buy', 'bids'), ('sell', 'asks')):
+            rows = []
+            for lvl in itertools.islice(self.levels(side), n):
+                user = sum(o.qty for o in lvl.orders.values() if o.owner == 'user')
+                rows.append((round(lvl.ticks * TICK, 3), lvl.qty, user))
+            out[name] = rows
+        self._depth = (n, out)
+        return out
@@ -0,0 +1,35 @@
+import math
+
+ORDER_TYPES = ("MARKET", "LIMIT", "IOC", "FOK")
+
+
+def place_order(sim, portfolio, sym, side, qty, typ="MARKET", price=None):
+    """Check an order against the account and send it to sim; raises ValueError with a user-facing message."""
+    if sym not in sim.index:
+        raise ValueError(f"Unknown symbol {sym}")
+    if side not in ("buy", "sell"):
+        raise ValueError("Side must be buy or sell")
+    if typ not in ORDER_TYPES:
+        raise ValueError(f"Order type must be one of {', '.join(ORDER_TYPES)}")
+    if qty <= 0:
+        raise ValueError("Quantity must be positive")
+    max_qty = portfolio.max_qty(sim.data[sym]['ask'])
+    if qty > max_qty:
+        raise ValueError(f"Max quantity is {max_qty:,}")
+    if typ == "MARKET":
+        price = None
+    elif price is None or not price > 0:
+        raise ValueError("Limit price required")
+    elif not math.isfinite(price):
+        raise ValueError("Limit price must be finite")
+    return sim.submit(sym, side, qty, price, tif="GTC" if typ in ("MARKET", "LIMIT") else typ)
+
+
+def close_position(sim, portfolio, sym):
+    """Flatten sym at market. Returns (execution, realized P&L), or None if there is no position."""
+    size, _ = portfolio.position(sym)
+    if size == 0:
+        return None
+    before = portfolio.realized
+    ex = sim.submit(sym, "sell" if size > 0 else "buy", abs(size))
+    return ex, portfolio.realized - before
@@ -0,0 +1,125 @@
+import numpy as np
+
+
+class Portfolio:
+    """Cash, positions and margin for a symbol universe, kept in arrays indexed by symbol ID.
+
+    Unrealized P&L and gross exposure are running totals. A price change or a
+    fill adjusts them in O(1) for that symbol, and mark_many does a whole
+    batch of symbols with two dot products. They are recomputed from scratch
+    every RESYNC updates so float error can't build up.
+    """
+
+    RESYNC = 4096
+
+    def __init__(self, symbols, cash=10000.0, leverage=1000):
+        self.symbols = list(symbols)
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        n = len(self.symbols)
+        self.size = np.zeros(n)
+        self.avg = np.zeros(n)
+        self.mark_px = np.zeros(n)
+        self.cash = float(cash)
+        self.leverage = leverage
+        self.realized = 0.0
+        self.unreal = 0.0
+        self.exposure = 0.0
+        self.open = set()
+        self._updates = 0
+
+    def recompute(self):
+        self.unreal = float(np.dot(self.size, self.mark_px - self.avg))
+        self.exposure = float(np.dot(np.abs(self.size), self.mark_px))
+        self._updates = 0
+
+    def _tick(self, n=1):
+        self._updates += n
+        if self._updates >= self.RESYNC:
+            self.recompute()
+
+    def set_prices(self, prices):
+        self.mark_px[:] = prices
+        self.recompute()
+
+    def mark(self, sym, price):
+        i = self.index[sym]
+        size = self.size[i]
+        if size:
+            d = price - self.mark_px[i]
+            self.unreal += size * d
+            self.exposure += abs(size) * d
+            self._tick()
+        self.mark_px[i] = price
+
+    def mark_many(self, idx, prices):
+        d = prices - self.mark_px[idx]
+        size = self.size[idx]
+        self.unreal += float(np.dot(size, d))
+        self.exposure += float(np.dot(np.abs(size), d))
+        self.mark_px[idx] = prices
+        self._tick(len(self.open) and len(idx))
+
+    def fill(self, sym, qty, price):
+        """Apply a signed fill at price; returns the realized P&L, which is booked to cash."""
+        i = self.index[sym]
+        size, avg, px = self.size[i], self.avg[i], self.mark_px[i]
+        realized = 0.0
+        new = size + qty
+        if size == 0 or (size > 0) == (qty > 0):
+            avg = (avg * size + price * qty) / new
+        else:
+            realized = (price - avg) * min(abs(qty), abs(size)) * (1 if size > 0 else -1)
+            if new == 0:
+                avg = 0.0
+            elif (new > 0) != (size > 0):
+                avg = price
+        self.unreal += new * (px - avg) - size * (px - self.avg[i])
+        self.exposure += (abs(new) - abs(size)) * px
+        self.size[i] = new
+        self.avg[i] = avg
+        if new:
+            self.open.add(i)
+        else:
+            self.open.discard(i)
+        self.cash += realized
+        self.realized += realized
+        self._tick()
+        return realized
+
+    def deposit(self, amount):
+        self.cash += amount
+
+    @property
+    def used_margin(self):
+        return self.exposure / self.leverage
+
+    @property
+    def equity(self):
+        return self.cash + self.unreal
+
+    @property
+    def free_margin(self):
+        return self.equity - self.used_margin
+
+    def max_qty(self, price):
+        margin_avail = self.cash - self.used_margin
+        return int((margin_avail * self.leverage) / price) if price > 0 else 0
+
+    def breached(self):
+        return bool(self.open) and self.free_margin < 0
+
+    def holds(self, sym):
+        return self.index[sym] in self.open
+
+    def position(self, sym):
+        i = self.index[sym]
+        return int(self.size[i]), float(self.avg[i])
+
+    def positions(self):
+        """Open positions as {sym: {'size', 'avg_price', 'unreal'}} in symbol order."""
+        out = {}
+        for i in sorted(self.open):
+            size, avg = self.size[i], self.avg[i]
+            out[self.symbols[i]] = {'size': int(size), 'avg_price': float(avg),
+                                    'unreal': float((self.mark_px[i] - avg) * size)}
+        return out
@@ -0,0 +1,467 @@
+import argparse
+import os
+import queue
+import struct
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from simulator import CHUNK, MarketSimulator, TickBatch, make_symbols
+
+# File layout: a 32-byte header, the symbol table (NAME_LEN bytes per symbol,
+# NUL padded), padding up to a 64-byte boundary, then fixed-width REC records
+# until the end of the file. The time index lives next to it in <path>.idx.
+MAGIC = b"SIMTAPE1"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIId")  # magic, version, record size, symbols, data offset, created
+NAME_LEN = 16
+
+TICK, TRADE, FILL, BAR, MARGIN = 1, 2, 3, 4, 5
+KINDS = {TICK: 'tick', TRADE: 'trade', FILL: 'fill', BAR: 'bar', MARGIN: 'margin_call'}
+
+# tick:   a=price b=bid c=ask
+# trade:  a=price, side, size; always follows the tick it printed on
+# fill:   a=price, side, size (the user's fills)
+# bar:    a..d=open/high/low/close, size=volume, tf, t=bar start
+# margin: a=equity b=used margin
+REC = np.dtype([('t', '<f8'), ('kind', 'u1'), ('side', 'i1'), ('tf', '<u2'), ('sym', '<u4'),
+                ('a', '<f8'), ('b', '<f8'), ('c', '<f8'), ('d', '<f8'), ('size', '<i8')])
+IDX = np.dtype([('t0', '<f8'), ('t1', '<f8'), ('start', '<i8'), ('count', '<i8')])
+
+
+def _data_offset(n_symbols):
+    return -(-(HEADER.size + n_symbols * NAME_LEN) // 64) * 64
+
+
+def read_header(f):
+    magic, version, rec_size, n, offset, created = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("not a tick recording")
+    if version != VERSION or rec_size != REC.itemsize:
+        raise ValueError(f"unsupported recording version {version} (record size {rec_size})")
+    names = f.read(n * NAME_LEN)
+    symbols = [names[j:j + NAME_LEN].rstrip(b"\0").decode() for j in range(0, len(names), NAME_LEN)]
+    return symbols, offset, created
+
+
+def write_header(f, symbols):
+    offset = _data_offset(len(symbols))
+    table = b""
+    for s in symbols:
+        name = s.encode()
+        if len(name) > NAME_LEN:
+            raise ValueError(f"Symbol name too long for the recording format: {s}")
+        table += name.ljust(NAME_LEN, b"\0")
+    head = HEADER.pack(MAGIC, VERSION, REC.itemsize, len(symbols), offset, time.time()) + table
+    f.write(head.ljust(offset, b"\0"))
+    return offset
+
+
+def batch_records(batch):
+    """A TickBatch as records: every tick in step order, each trade right after its tick."""
+    n, k = batch.price.shape
+    trade = batch.trade.ravel()
+    pos = np.arange(n * k) + np.cumsum(trade) - trade
+    out = np.zeros(n * k + int(trade.sum()), REC)
+    ticks = out[pos]
+    ticks['t'] = np.repeat(batch.times, k)
+    ticks['kind'] = TICK
+    ticks['sym'] = np.tile(batch.idx, n)
+    ticks['a'] = batch.price.ravel()
+    ticks['b'] = batch.bid.ravel()
+    ticks['c'] = batch.ask.ravel()
+    out[pos] = ticks
+    tp = pos[trade] + 1
+    trades = ticks[trade]
+    trades['kind'] = TRADE
+    trades['side'] = batch.side.ravel()[trade]
+    trades['size'] = batch.size.ravel()[trade]
+    trades['a'] = batch.trade_price.ravel()[trade]
+    trades['b'] = trades['c'] = 0
+    out[tp] = trades
+    return out
+
+
+class Recorder:
+    """Append-only tick recorder with a background writer thread.
+
+    Producers only hand over references: write_batch() queues a TickBatch and
+    bus events are picked up from the `feed` subscription. Every `interval`
+    seconds the writer thread turns everything pending into records, writes
+    them with a single call, flushes, and appends one entry to the time index.
+    Completed base bars of `sim`'s candle store are recorded as they close;
+    the store is looked up on every write, since resetting the simulator
+    (e.g. priming a replay) replaces it.
+
+    Opening an existing recording appends to it; the symbol table must match.
+    """
+
+    def __init__(self, path, symbols, feed=None, sim=None, interval=0.25):
+        self.path = path
+        self.symbols = list(symbols)
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        self.feed = feed
+        self.sim = sim
+        self.interval = interval
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as f:
+                have, offset, _ = read_header(f)
+            if have != self.symbols:
+                raise ValueError(f"{path} was recorded with a different symbol table")
+            self.records = (os.path.getsize(path) - offset) // REC.itemsize
+            # drop a partial record left by a crash so the file stays aligned
+            os.truncate(path, offset + self.records * REC.itemsize)
+            self.file = open(path, "ab")
+        else:
+            self.file = open(path, "wb")
+            write_header(self.file, self.symbols)
+            self.records = 0
+        self.index_file = open(path + ".idx", "ab")
+        self.pending = queue.SimpleQueue()
+        self.clock = 0.0
+        self.store = None
+        self.bars = 0
+        self.writes = 0
+        self.bytes = 0
+        self.write_ms = 0.0
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        else:
+            self._write()
+        self.file.close()
+        self.index_file.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_batch(self, batch):
+        """Queue a TickBatch; usable directly as run_fast's on_batch."""
+        self.pending.put(batch)
+
+    def write_events(self, events):
+        self.pending.put(events)
+
+    def _event_records(self, events):
+        out = []
+        trades = {}
+        for e in events:
+            kind = e.kind
+            if kind == 'trade':
+                trades[e.sym] = e
+            elif kind == 'tick':
+                self.clock = e.time
+                i = self.index[e.sym]
+                out.append((e.time, TICK, 0, 0, i, e.price, e.bid, e.ask, 0.0, 0))
+                tr = trades.pop(e.sym, None)
+                if tr is not None:
+                    out.append((e.time, TRADE, 1 if tr.side == 'buy' else -1, 0, i, tr.price, 0.0, 0.0, 0.0, tr.size))
+            elif kind == 'fill':
+                out.append((self.clock, FILL, 1 if e.side == 'buy' else -1, 0, self.index[e.sym],
+                            e.price, 0.0, 0.0, 0.0, e.qty))
+            elif kind == 'margin_call':
+                out.append((self.clock, MARGIN, 0, 0, 0, e.equity, e.used_margin, 0.0, 0.0, 0))
+        for tr in trades.values():
+            out.append((self.clock, TRADE, 1 if tr.side == 'buy' else -1, 0, self.index[tr.sym],
+                        tr.price, 0.0, 0.0, 0.0, tr.size))
+        return np.array(out, REC)
+
+    def _bar_records(self, store):
+        if store is not self.store:
+            self.store, self.bars = store, 0
+        f = store.frames[store.base]
+        with store.lock:
+            done = f.count - 1  # the newest bar is still open
+            first = max(self.bars, done - f.capacity + 1)
+            if done <= first:
+                return None
+            slots = np.arange(first, done) % f.capacity
+            k = len(self.symbols)
+            out = np.zeros((len(slots), k), REC)
+            out['t'] = f.time[slots, None]
+            out['kind'] = BAR
+            out['tf'] = f.tf
+            out['sym'] = np.arange(k)
+            out['a'] = f.open[slots]
+            out['b'] = f.high[slots]
+            out['c'] = f.low[slots]
+            out['d'] = f.close[slots]
+            out['size'] = f.volume[slots]
+        self.bars = done
+        return out.ravel()
+
+    def _write(self):
+        chunks = []
+        while True:
+            try:
+                item = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, TickBatch):
+                chunks.append(batch_records(item))
+                self.clock = float(item.times[-1])
+            else:
+                chunks.append(self._event_records(item))
+        if self.feed is not None:
+            chunks.append(self._event_records(self.feed.drain()))
+        store = None if self.sim is None else self.sim.candles
+        if store is not None:
+            bars = self._bar_records(store)
+            if bars is not None:
+                chunks.append(bars)
+        chunks = [c for c in chunks if len(c)]
+        if not chunks:
+            return
+        t0 = time.perf_counter()
+        recs = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+        self.file.write(recs.data)
+        self.file.flush()
+        t = recs['t']
+        entry = np.array([(t.min(), t.max(), self.records, len(recs))], IDX)
+        self.index_file.write(entry.data)
+        self.index_file.flush()
+        self.records += len(recs)
+        self.writes += 1
+        self.bytes += recs.nbytes
+        self.write_ms = (time.perf_counter() - t0) * 1000
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+        self._write()
+
+    def stats(self):
+        return {'records': self.records, 'writes': self.writes, 'bytes': self.bytes,
+                'pending': self.pending.qsize(), 'write_ms': self.write_ms}
+
+
+def record(sim, path, interval=0.25):
+    """Start recording everything sim publishes on its bus, plus its closed bars."""
+    feed = sim.bus.subscribe("recorder", capacity=65536)
+    return Recorder(path, sim.symbols, feed=feed, sim=sim, interval=interval).start()
+
+
+class Replay:
+    """Read-only view of a recording through a memory map.
+
+    `records` is a structured NumPy array backed directly by the file, so
+    opening a recording costs nothing and every column is a strided view.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.symbols, offset, self.created = read_header(f)
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        n = (os.path.getsize(path) - offset) // REC.itemsize
+        self.records = np.memmap(path, REC, "r", offset, (n,)) if n else np.empty(0, REC)
+        idx_path = path + ".idx"
+        toc = np.fromfile(idx_path, IDX) if os.path.exists(idx_path) else np.empty(0, IDX)
+        self.toc = toc[toc['start'] + toc['count'] <= n]
+        self._market = None
+        self._bars = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def kind(self, kind):
+        return self.records[self.records['kind'] == kind]
+
+    def span(self):
+        if len(self.toc):
+            return float(self.toc['t0'].min()), float(self.toc['t1'].max())
+        t = self.records['t']
+        return (float(t.min()), float(t.max())) if len(t) else (0.0, 0.0)
+
+    def between(self, t0, t1, kind=None):
+        """Records stamped in [t0, t1); the time index limits the scan to the chunks that overlap."""
+        recs = self.records
+        if len(self.toc):
+            hit = self.toc[(self.toc['t1'] >= t0) & (self.toc['t0'] < t1)]
+            if not len(hit):
+                return recs[:0]
+            recs = recs[hit['start'].min():(hit['start'] + hit['count']).max()]
+        t = recs['t']
+        mask = (t >= t0) & (t < t1)
+        if kind is not None:
+            mask &= recs['kind'] == kind
+        return recs[mask]
+
+    def fills(self):
+        return self.kind(FILL)
+
+    def bars(self, sym, tf=None):
+        """Recorded bars of one symbol as a dict of arrays, shaped like CandleStore.view.
+
+        Bars are recorded at the base timeframe; a larger tf is aggregated from them.
+        """
+        if self._bars is None:
+            self._bars = self.kind(BAR)
+        b = self._bars[self._bars['sym'] == self.index[sym]]
+        times = b['t'].astype(np.int64)
+        if tf is None or not len(b) or tf == b['tf'][0]:
+            return {'time': times, 'open': b['a'], 'high': b['b'], 'low': b['c'],
+                    'close': b['d'], 'volume': b['size']}
+        buckets = times // tf * tf
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(b)] - 1
+        return {'time': buckets[starts], 'open': b['a'][starts],
+                'high': np.maximum.reduceat(b['b'], starts), 'low': np.minimum.reduceat(b['c'], starts),
+                'close': b['d'][ends], 'volume': np.add.reduceat(b['size'], starts)}
+
+    def market(self):
+        """Ticks with their trades folded in, plus each tick's position in the file."""
+        if self._market is None:
+            kinds = self.records['kind']
+            pos = np.flatnonzero((kinds == TICK) | (kinds == TRADE))
+            recs = self.records[pos]
+            is_tick = recs['kind'] == TICK
+            owner = (np.cumsum(is_tick) - 1)[~is_tick]
+            ticks = recs[is_tick]
+            trades = recs[~is_tick]
+            keep = owner >= 0
+            owner, trades = owner[keep], trades[keep]
+            n = len(ticks)
+            trade = np.zeros(n, bool)
+            side = np.zeros(n, np.int8)
+            size = np.zeros(n, np.int64)
+            trade_price = ticks['a'].copy()
+            trade[owner] = True
+            side[owner] = trades['side']
+            size[owner] = trades['size']
+            trade_price[owner] = trades['a']
+            self._market = (ticks, trade, side, size, trade_price, pos[is_tick])
+        return self._market
+
+    def batches(self, max_steps=CHUNK):
+        """Yield (file position, TickBatch) in recording order.
+
+        Consecutive steps that cover the same symbols in the same order (a
+        run_fast recording) are stacked into one batch of up to max_steps
+        steps; a wall-clock recording comes back one tick per batch.
+        """
+        ticks, trade, side, size, trade_price, pos = self.market()
+        t = ticks['t']
+        if not len(t):
+            return
+        starts = np.flatnonzero(np.r_[True, t[1:] != t[:-1]])
+        sizes = np.diff(np.r_[starts, len(t)])
+        j = 0
+        while j < len(starts):
+            k = sizes[j]
+            same = sizes[j:j + max_steps] == k
+            m = len(same) if same.all() else int(np.argmin(same))
+            s0 = starts[j]
+            syms = ticks['sym'][s0:s0 + m*k].reshape(m, k)
+            ok = (syms == syms[0]).all(axis=1)
+            if not ok.all():
+                m = int(np.argmin(ok))
+            w = slice(s0, s0 + m*k)
+            yield int(pos[s0]), TickBatch(t[w][::k].copy(), syms[0].astype(np.intp),
+                                          *(a[w].reshape(m, k) for a in (ticks['a'], ticks['b'], ticks['c'],
+                                                                        trade, side, size, trade_price)))
+            j += m
+
+    def prime(self, sim):
+        """Reset sim to the first recorded quote of every symbol."""
+        ticks = self.market()[0]
+        price, bid, ask = sim.price.copy(), sim.bid.copy(), sim.ask.copy()
+        syms, first = np.unique(ticks['sym'], return_index=True)
+        price[syms], bid[syms], ask[syms] = ticks['a'][first], ticks['b'][first], ticks['c'][first]
+        sim.reset_prices(price, bid, ask, float(ticks['t'][0]) if len(ticks) else None)
+
+    def feed(self, sim, speed=None, fills=True, max_steps=CHUNK, publish=True):
+        """Drive sim from the recording instead of its random walk.
+
+        Prices, candles, order books and the attached portfolio all follow the
+        recorded ticks. With fills the user's recorded fills are re-applied to
+        the portfolio at the point they happened (and the simulator does not
+        liquidate on its own). speed=None runs as fast as possible; otherwise
+        the recording plays at speed times real time.
+        """
+        if sim.symbols != self.symbols:
+            raise ValueError("simulator symbols do not match the recording")
+        fill_recs = self.fills() if fills and sim.portfolio is not None else self.records[:0]
+        fill_pos = np.flatnonzero(self.records['kind'] == FILL) if len(fill_recs) else np.empty(0, np.int64)
+        self.prime(sim)
+        nf = 0
+        ticks = 0
+        wall0 = t_first = None
+        for pos, batch in self.batches(max_steps):
+            while nf < len(fill_pos) and fill_pos[nf] < pos:
+                f = fill_recs[nf]
+                with sim.lock:
+                    sim.portfolio.fill(self.symbols[f['sym']], int(f['size']) * int(f['side']), float(f['a']))
+                nf += 1
+            if speed:
+                if wall0 is None:
+                    wall0, t_first = time.perf_counter(), batch.times[0]
+                lag = (batch.times[0] - t_first) / speed - (time.perf_counter() - wall0)
+                if lag > 0:
+                    time.sleep(lag)
+            sim.apply(batch, liquidate=not len(fill_recs))
+            if publish:
+                sim.publish_batch(batch)
+            ticks += batch.price.size
+        return ticks
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Record and replay simulator sessions")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rec = sub.add_parser("record", help="record a max-speed simulator run")
+    rec.add_argument("path")
+    rec.add_argument("--symbols", type=int, default=10)
+    rec.add_argument("--steps", type=int, default=100000)
+    rec.add_argument("--batch", type=int, default=CHUNK)
+    rec.add_argument("--seed", type=int, default=None)
+    info = sub.add_parser("info", help="summarize a recording")
+    info.add_argument("path")
+    rep = sub.add_parser("replay", help="replay a recording through a headless simulator")
+    rep.add_argument("path")
+    rep.add_argument("--speed", type=float, default=None, help="times real time (default: max speed)")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "record":
+        sim = MarketSimulator(make_symbols(args.symbols), seed=args.seed)
+        t0 = time.perf_counter()
+        with Recorder(args.path, sim.symbols, sim=sim) as r:
+            ticks = sim.run_fast(args.steps, args.batch, on_batch=r.write_batch)
+            sim_s = time.perf_counter() - t0
+        elapsed = time.perf_counter() - t0
+        print(f"{ticks:,} ticks simulated in {sim_s:.3f}s, {r.records:,} records "
+              f"({r.bytes / 2**20:,.1f} MiB) on disk after {elapsed:.3f}s ({ticks / elapsed:,.0f} ticks/s)")
+    elif args.cmd == "info":
+        r = Replay(args.path)
+        t0, t1 = r.span()
+        counts = np.bincount(r.records['kind'], minlength=max(KINDS) + 1)
+        print(f"{args.path}: {len(r.symbols)} symbols, {len(r):,} records of {REC.itemsize} bytes, "
+              f"{len(r.toc):,} index entries")
+        print(f"  {datetime.fromtimestamp(t0)} .. {datetime.fromtimestamp(t1)} ({t1 - t0:,.1f}s)")
+        print("  " + ", ".join(f"{name}: {counts[k]:,}" for k, name in KINDS.items()))
+    else:
+        r = Replay(args.path)
+        sim = MarketSimulator(r.symbols)
+        t0 = time.perf_counter()
+        ticks = r.feed(sim, args.speed, publish=False)
+        elapsed = time.perf_counter() - t0
+        t_rec = np.subtract(*r.span()[::-1])
+        print(f"{ticks:,} ticks replayed in {elapsed:.3f}s ({ticks / elapsed:,.0f} ticks/s, "
+              f"{t_rec / elapsed:,.0f}x real time)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import time
+
+from metrics import METRICS
+
+
+class RenderScheduler:
+    """Dirty-flag refresh loop on top of Tk's after().
+
+    Components register a refresh callback and get marked dirty by events.
+    Each frame first runs the poll callback (draining whatever arrived since
+    the last frame), then calls every dirty component once, so a burst of N
+    events costs one refresh per component rather than N.
+    """
+
+    def __init__(self, root, fps=30, poll=None):
+        self.root = root
+        self.fps = fps
+        self.poll = poll
+        self.components = {}
+        self.dirty = set()
+        self.frames = 0
+        self.events = 0
+        self.coalesced = 0
+        self.refreshes = {}
+        self.frame_ms = 0.0
+        self.avg_frame_ms = 0.0
+        self.max_frame_ms = 0.0
+        self._job = None
+        self._frame_span = METRICS.span("ui.frame")
+        self._poll_span = METRICS.span("ui.drain")
+        self._spans = {}
+
+    @property
+    def interval(self):
+        return max(1, int(1000 / self.fps))
+
+    def register(self, name, fn):
+        self.components[name] = fn
+        self.refreshes[name] = 0
+        self._spans[name] = METRICS.span(f"ui.{name}")
+
+    def mark(self, *names):
+        for name in names:
+            self.events += 1
+            if name in self.dirty:
+                self.coalesced += 1
+            else:
+                self.dirty.add(name)
+
+    def frame(self):
+        t0 = time.perf_counter_ns()
+        if self.poll is not None:
+            with self._poll_span:
+                self.poll()
+        # components may mark each other while refreshing; those land in the next frame
+        dirty, self.dirty = self.dirty, set()
+        for name, fn in self.components.items():
+            if name in dirty:
+                with self._spans[name]:
+                    fn()
+                self.refreshes[name] += 1
+        ns = time.perf_counter_ns() - t0
+        self._frame_span.record(ns)
+        ms = ns / 1e6
+        self.frames += 1
+        self.frame_ms = ms
+        self.avg_frame_ms += (ms - self.avg_frame_ms) * 0.05
+        self.max_frame_ms = max(self.max_frame_ms, ms)
+        return ms
+
+    def start(self):
+        self._job = self.root.after(self.interval, self._loop)
+
+    def stop(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _loop(self):
+        ms = self.frame()
+        # keep the frame rate steady when a frame runs long instead of queuing up behind it
+        self._job = self.root.after(max(1, self.interval - int(ms)), self._loop)
+
+    def stats(self):
+        return {'fps': self.fps, 'frames': self.frames, 'events': self.events,
+                'coalesced': self.coalesced, 'frame_ms': self.frame_ms,
+                'avg_frame_ms': self.avg_frame_ms, 'max_frame_ms': self.max_frame_ms,
+                'refreshes': dict(self.refreshes)}
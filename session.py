@@ -0,0 +1,148 @@
+import time
+
+STARTED = time.perf_counter()  # before the imports below, so startup timings include them
+
+import argparse
+import threading
+
+from metrics import METRICS, Exporter
+from portfolio import Portfolio
+from simulator import MarketSimulator, make_symbols
+
+
+class Session:
+    """The market side of the terminal with no GUI attached.
+
+    A simulated, sharded or replayed market, the account trading on it, and
+    the optional recorder, gateway and metrics export. The heavier modules
+    (asyncio for the gateway, shared memory for shards, the recorder) are
+    imported only when a session asks for them. Startup milestones are kept
+    in `startup` as ms since `started` and exported as startup.* gauges.
+    """
+
+    LEVERAGE = 1000
+    CASH = 10000.0
+
+    def __init__(self, symbols=None, workers=0, replay=None, speed=1.0, record_to=None, gateway=None,
+                 metrics_to=None, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.startup = {}
+        self.speed = speed
+        self.replay = None
+        self.sharded = bool(workers)
+        if replay:
+            from recorder import Replay
+            self.replay = Replay(replay)
+            self.sim = MarketSimulator(self.replay.symbols)
+        elif workers:
+            from shard import ShardedMarket
+            self.sim = ShardedMarket(make_symbols(symbols or 10), workers)
+        else:
+            self.sim = MarketSimulator(make_symbols(symbols) if symbols else None)
+        self.portfolio = Portfolio(self.sim.symbols, cash=self.CASH, leverage=self.LEVERAGE)
+        self.sim.attach(self.portfolio)
+        self.recorder = None
+        if record_to:
+            from recorder import record
+            self.recorder = record(self.sim, record_to)
+        self.gateway = None
+        if gateway is not None:
+            # web clients see the same market and account as the window
+            from gateway import Gateway
+            self.gateway = Gateway(self.sim, self.portfolio, port=gateway).start_thread()
+        self.exporter = Exporter(METRICS, metrics_to) if metrics_to else None
+        self.mark("session")
+
+    def mark(self, name):
+        """Record a startup milestone once; later calls keep the first time."""
+        if name not in self.startup:
+            ms = self.startup[name] = (time.perf_counter() - self.started) * 1000
+            METRICS.gauge(f"startup.{name}_ms", lambda: ms)
+
+    def start(self):
+        """Start feeding the market from a daemon thread."""
+        if self.replay is not None:
+            # the recorded market plays back; orders placed now trade against it live
+            feed = lambda: self.replay.feed(self.sim, self.speed, fills=False)
+        else:
+            feed = self.sim.run
+        threading.Thread(target=feed, daemon=True).start()
+        self.mark("feed")
+        return self
+
+    def wait_first_tick(self, timeout=None, every=0.001):
+        """Block until the market has produced a tick; returns False on timeout."""
+        end = None if timeout is None else time.perf_counter() + timeout
+        while not self.sim.ticks:
+            if end is not None and time.perf_counter() > end:
+                return False
+            time.sleep(every)
+        self.mark("first_tick")
+        return True
+
+    def stats(self):
+        p = self.portfolio
+        return {'ticks': self.sim.ticks, 'equity': p.equity, 'unreal': p.unreal, 'used_margin': p.used_margin,
+                'positions': len(p.open), 'startup_ms': dict(self.startup)}
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.sharded:
+            self.sim.close()
+
+
+def add_arguments(ap):
+    """The market, account and export options shared by this CLI and the terminal's."""
+    ap.add_argument("--record", metavar="PATH", help="record the session to a tick file")
+    ap.add_argument("--replay", metavar="PATH", help="play back a recorded session instead of simulating")
+    ap.add_argument("--speed", type=float, default=1.0, help="replay speed, times real time")
+    ap.add_argument("--symbols", type=int, default=None, help="size of the symbol universe")
+    ap.add_argument("--workers", type=int, default=0, help="simulate in this many worker processes")
+    ap.add_argument("--gateway", type=int, metavar="PORT", help="serve WebSocket/HTTP clients on this port")
+    ap.add_argument("--metrics", metavar="PATH", help="export timings every second (.prom: Prometheus text, else JSON lines)")
+    ap.add_argument("--seconds", type=float, default=None, help="headless: stop after this long (default: until Ctrl-C)")
+    ap.add_argument("--interval", type=float, default=5.0, help="headless: seconds between status lines")
+
+
+def from_args(args, started=None):
+    return Session(symbols=args.symbols, workers=args.workers, replay=args.replay, speed=args.speed,
+                   record_to=args.record, gateway=args.gateway, metrics_to=args.metrics, started=started)
+
+
+def headless(session, seconds=None, interval=5.0):
+    """Run the market with no window, printing a status line every interval seconds."""
+    session.start()
+    if session.gateway is not None:
+        print(f"gateway on http://127.0.0.1:{session.gateway.port}/")
+    try:
+        if not session.wait_first_tick(timeout=10.0):
+            print("no tick within 10s")
+        print("startup " + "  ".join(f"{k} {v:.1f} ms" for k, v in session.startup.items()))
+        t0 = last_t = time.perf_counter()
+        last = session.sim.ticks
+        while seconds is None or last_t - t0 < seconds:
+            time.sleep(interval if seconds is None else max(0.0, min(interval, t0 + seconds - last_t)))
+            s = session.stats()
+            now = time.perf_counter()
+            print(f"{now - t0:7.1f}s  ticks {s['ticks']:>12,} ({(s['ticks'] - last) / (now - last_t):>10,.0f}/s)  "
+                  f"equity ${s['equity']:>14,.2f}  positions {s['positions']}")
+            last, last_t = s['ticks'], now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
+    print(METRICS.table())
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run the terminal's market, account and gateway without a window")
+    add_arguments(ap)
+    args = ap.parse_args(argv)
+    headless(from_args(args, STARTED), args.seconds, args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+import argparse
+import os
+import threading
+import time
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+from eventbus import Dom, EventBus, Fill, MarginCall, Tick, Trade
+from metrics import METRICS
+from simulator import FIELDS, LIQUIDATION_ROUNDS, MARGIN_CALLS, MARKED_OUT, MarketSimulator, make_symbols
+
+# One row per symbol. `seq` is a seqlock: the owning worker makes it odd
+# while it writes the row and even again afterwards.
+TOP = np.dtype([('seq', '<u8'), ('price', '<f8'), ('bid', '<f8'), ('ask', '<f8'), ('time', '<f8'),
+                ('last_price', '<f8'), ('last_size', '<i8'), ('last_side', '<i8'),
+                ('trades', '<u8'), ('volume', '<u8')])
+STATS = np.dtype([('ticks', '<u8'), ('batches', '<u8'), ('busy', '<f8'), ('pid', '<i8')])
+
+
+def _attach(name, n, workers):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, *_views(shm, n, workers)
+
+
+def _views(shm, n, workers):
+    top = np.ndarray(n, TOP, shm.buf)
+    stats = np.ndarray(workers, STATS, shm.buf, offset=n * TOP.itemsize)
+    return top, stats
+
+
+class _Publisher:
+    """Worker side: writes its shard's rows of the shared block after every batch."""
+
+    def __init__(self, top, lo, hi):
+        self.rows = top[lo:hi]
+
+    def write(self, sim, batch=None):
+        rows = self.rows
+        rows['seq'] += 1
+        rows['price'] = sim.price
+        rows['bid'] = sim.bid
+        rows['ask'] = sim.ask
+        if batch is not None:
+            rows['time'] = batch.times[-1]
+            traded = batch.trade.any(axis=0)
+            if traded.any():
+                n = len(batch.times)
+                last = n - 1 - np.argmax(batch.trade[::-1], axis=0)
+                cols = np.flatnonzero(traded)
+                r = last[cols]
+                rows['last_price'][cols] = batch.trade_price[r, cols]
+                rows['last_size'][cols] = batch.size[r, cols]
+                rows['last_side'][cols] = batch.side[r, cols]
+                rows['trades'] += batch.trade.sum(axis=0).astype(np.uint64)
+                rows['volume'] += np.where(batch.trade, batch.size, 0).sum(axis=0).astype(np.uint64)
+        rows['seq'] += 1
+
+
+def _worker(shard, name, symbols, lo, hi, workers, seed, interval, batch, retention, conn, fills, stop):
+    shm, top, stats = _attach(name, len(symbols), workers)
+    sim = MarketSimulator(symbols[lo:hi], seed=seed, retention=retention)
+    feed = sim.bus.subscribe("shard", policy='drop_oldest')
+    pub = _Publisher(top, lo, hi)
+    me = stats[shard:shard + 1]
+    me['pid'] = os.getpid()
+    pub.write(sim)
+    conn.send(('ready', None, []))
+
+    def handle(msg):
+        cmd, args = msg[0], msg[1:]
+        try:
+            if cmd == 'submit':
+                result = sim.submit(*args)
+            elif cmd == 'cancel':
+                result = sim.cancel(*args)
+            elif cmd == 'cancel_all':
+                result = sim.cancel_all(*args)
+            elif cmd == 'depth':
+                result = sim.depth(*args)
+            elif cmd == 'history':
+                result = {k: np.array(v) for k, v in sim.candles.view(*args).items()}
+            elif cmd == 'study':
+                result = {k: np.array(v) for k, v in sim.candles.study(*args).items()}
+            else:
+                raise ValueError(f"Unknown command {cmd}")
+        except Exception as e:
+            conn.send(('err', e, feed.drain()))
+        else:
+            conn.send(('ok', result, feed.drain()))
+
+    try:
+        deadline = time.perf_counter()
+        while not stop.is_set():
+            # commands are served between batches, and while waiting for the next one in paced mode
+            wait = max(0.0, deadline - time.perf_counter()) if interval else 0.0
+            while conn.poll(wait):
+                handle(conn.recv())
+                wait = max(0.0, deadline - time.perf_counter()) if interval else 0.0
+            t0 = time.perf_counter()
+            b = sim.step(batch, now=time.time() if interval else None)
+            # keep books someone has looked at quoting, so resting user orders can fill
+            for sym in list(sim.books):
+                sim.book(sym)
+            pub.write(sim, b)
+            events = feed.drain()
+            if events:
+                fills.put(events)
+            me['ticks'] += b.price.size
+            me['batches'] += 1
+            me['busy'] += time.perf_counter() - t0
+            if interval:
+                deadline = max(deadline + interval, time.perf_counter() - interval)
+    finally:
+        del top, stats, me, pub
+        shm.close()
+
+
+class _SharedState:
+    """sim.data[sym] for a sharded market: reads the symbol's row of the shared block."""
+    __slots__ = ('_top', '_i')
+
+    def __init__(self, top, i):
+        self._top = top
+        self._i = i
+
+    def __getitem__(self, key):
+        if key not in ('price', 'bid', 'ask'):
+            if key in FIELDS:
+                raise KeyError(f"{key} is private to the owning worker")
+            raise KeyError(key)
+        return self._top[key][self._i].item()
+
+    def keys(self):
+        return ('price', 'bid', 'ask')
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+
+class ShardedMarket:
+    """The symbol universe split across worker processes.
+
+    Each worker runs its own MarketSimulator over a contiguous range of
+    symbols and owns their prices, candles and books. Top of book and last
+    trade go to a shared-memory block (`top`) that any thread of this process
+    reads without copying or locking; snapshot() gives a torn-free copy.
+    Orders, depth and candle history are forwarded to the owning worker.
+
+    run() is the consumer side of the block for MarketSimulator-style users:
+    it polls for updated rows, marks the attached portfolio, liquidates on a
+    margin call and publishes Tick/Trade/Dom/Fill events on self.bus. Only
+    symbols in watch() (plus open positions) get events.
+
+    interval=None runs the workers flat out (benchmarks); otherwise every
+    worker advances all its symbols by `batch` steps every `interval` seconds.
+    """
+
+    def __init__(self, symbols=None, workers=None, seed=None, interval=0.135, batch=1, retention=600):
+        self.symbols = list(symbols) if symbols is not None else make_symbols(10)
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        n = len(self.symbols)
+        workers = max(1, min(workers or os.cpu_count() or 1, n))
+        self.workers = workers
+        self.shm = shared_memory.SharedMemory(create=True, size=n * TOP.itemsize + workers * STATS.itemsize)
+        self.top, self.stats_block = _views(self.shm, n, workers)
+        self.top[:] = 0
+        self.stats_block[:] = 0
+        self.bounds = np.linspace(0, n, workers + 1).astype(int)
+        self.owner = np.repeat(np.arange(workers), np.diff(self.bounds))
+
+        ctx = get_context("spawn")  # the UI process has threads running; don't fork it
+        self._stop = ctx.Event()
+        self._fills = ctx.Queue()
+        self.procs = []
+        self.conns = []
+        self.conn_locks = [threading.Lock() for _ in range(workers)]
+        for w in range(workers):
+            parent, child = ctx.Pipe()
+            p = ctx.Process(target=_worker, name=f"shard-{w}", daemon=True,
+                            args=(w, self.shm.name, self.symbols, int(self.bounds[w]), int(self.bounds[w + 1]),
+                                  workers, None if seed is None else seed + w, interval, batch, retention,
+                                  child, self._fills, self._stop))
+            p.start()
+            self.procs.append(p)
+            self.conns.append(parent)
+        for conn in self.conns:
+            conn.recv()
+
+        self.bus = EventBus()
+        self.lock = threading.RLock()
+        self.portfolio = None
+        self.candles = None
+        self.data = {s: _SharedState(self.top, i) for i, s in enumerate(self.symbols)}
+        self.watched = np.ones(n, bool)
+        self._seen = self.top['seq'].copy()
+        self._trades = self.top['trades'].copy()
+        self.poll_ms = 0.0
+        self._poll_span = METRICS.span("shard.poll")
+
+    @property
+    def price(self):
+        return self.top['price']
+
+    @property
+    def bid(self):
+        return self.top['bid']
+
+    @property
+    def ask(self):
+        return self.top['ask']
+
+    @property
+    def ticks(self):
+        return int(self.stats_block['ticks'].sum())
+
+    def snapshot(self, idx=None):
+        """A consistent copy of the rows in idx (default: all), retrying any a worker was writing."""
+        idx = np.arange(len(self.symbols)) if idx is None else np.asarray(idx)
+        seq = self.top['seq']
+        rows = self.top[idx]
+        while True:
+            torn = np.flatnonzero((rows['seq'] != seq[idx]) | (rows['seq'] & 1 == 1))
+            if not len(torn):
+                return rows
+            time.sleep(0)
+            rows[torn] = self.top[idx[torn]]
+
+    def watch(self, symbols):
+        """Only publish events for these symbols (and open positions); None publishes everything."""
+        if symbols is None:
+            self.watched[:] = True
+        else:
+            self.watched[:] = False
+            self.watched[[self.index[s] for s in symbols]] = True
+
+    def _call(self, sym, *msg):
+        w = self.owner[self.index[sym]]
+        with self.conn_locks[w]:
+            self.conns[w].send(msg)
+            status, result, events = self.conns[w].recv()
+        self._book(events)
+        if status == 'err':
+            raise result
+        return result
+
+    def _book(self, events):
+        fills = [e for e in events if e.kind == 'fill']
+        if not fills:
+            return
+        if self.portfolio is not None:
+            with self.lock:
+                for f in fills:
+                    self.portfolio.fill(f.sym, f.qty if f.side == 'buy' else -f.qty, f.price)
+        self.bus.publish(fills)
+
+    def attach(self, portfolio):
+        with self.lock:
+            self.portfolio = portfolio
+            portfolio.set_prices(self.price)
+
+    def submit(self, sym, side, qty, price=None, tif='GTC', owner='user'):
+        return self._call(sym, 'submit', sym, side, qty, price, tif, owner)
+
+    def cancel(self, sym, oid):
+        return self._call(sym, 'cancel', sym, oid)
+
+    def cancel_all(self, sym, owner='user'):
+        return self._call(sym, 'cancel_all', sym, owner)
+
+    def depth(self, sym, n=15):
+        return self._call(sym, 'depth', sym, n)
+
+    def get_history(self, sym, tf, n=None):
+        return self._call(sym, 'history', sym, tf, n)
+
+    def get_study(self, sym, tf, spec, n=None):
+        return self._call(sym, 'study', sym, tf, spec, n)
+
+    def liquidate(self):
+        """As MarketSimulator.liquidate, sweeping each position while its worker's book still fills."""
+        with self.lock:
+            p = self.portfolio
+            equity, used = p.equity, p.used_margin
+            marked = []
+            for sym in p.positions():
+                for _ in range(LIQUIDATION_ROUNDS):
+                    size = p.position(sym)[0]
+                    if not size or not self.submit(sym, 'sell' if size > 0 else 'buy', abs(size)).filled:
+                        break
+                size = p.position(sym)[0]
+                if size:
+                    side, price = 'sell' if size > 0 else 'buy', float(self.price[self.index[sym]])
+                    p.fill(sym, -size, price)
+                    self.bus.publish([Fill(sym, side, abs(size), price, None)])
+                    marked.append((sym, abs(size)))
+                    MARKED_OUT.inc(abs(size))
+            MARGIN_CALLS.inc()
+            self.bus.publish([MarginCall(equity, used, tuple(marked))])
+
+    def poll(self):
+        """Pick up everything the workers published since the last poll."""
+        t0 = time.perf_counter()
+        while not self._fills.empty():
+            self._book(self._fills.get())
+        seq = self.top['seq']
+        changed = np.flatnonzero(seq != self._seen)
+        if not len(changed):
+            return 0
+        rows = self.snapshot(changed)
+        self._seen[changed] = rows['seq']
+        p = self.portfolio
+        if p is not None:
+            with self.lock:
+                p.mark_many(changed, rows['price'])
+                if p.breached():
+                    self.liquidate()
+
+        show = self.watched[changed]
+        if p is not None and p.open:
+            show |= np.isin(changed, list(p.open))
+        events = []
+        for i, r in zip(changed[show].tolist(), rows[show]):
+            sym = self.symbols[i]
+            if r['trades'] != self._trades[i]:
+                self._trades[i] = r['trades']
+                events.append(Trade(sym, 'buy' if r['last_side'] > 0 else 'sell', int(r['last_size']),
+                                    round(float(r['last_price']), 3),
+                                    time.strftime("%H:%M:%S", time.localtime(r['time'])) +
+                                    f".{int(r['time'] % 1 * 1000):03d}"))
+            events.append(Tick(sym, float(r['price']), float(r['bid']), float(r['ask']), float(r['time'])))
+            events.append(Dom(sym))
+        self.bus.publish(events)
+        self.poll_ms = (time.perf_counter() - t0) * 1000
+        self._poll_span.record(int(self.poll_ms * 1e6))
+        return len(changed)
+
+    def run(self, steps=None, every=0.02):
+        """Poll the shared block until close(); steps bounds the number of polls."""
+        n = 0
+        while not self._stop.is_set() and (steps is None or n < steps):
+            self.poll()
+            time.sleep(every)
+            n += 1
+
+    def stats(self):
+        s = self.stats_block
+        return {'workers': self.workers, 'symbols': len(self.symbols), 'ticks': self.ticks,
+                'per_worker': s['ticks'].tolist(), 'busy_s': s['busy'].tolist(), 'poll_ms': self.poll_ms}
+
+    def close(self):
+        self._stop.set()
+        for p in self.procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        del self.top, self.stats_block, self.data
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Throughput of the sharded simulator by worker count")
+    ap.add_argument("--symbols", type=int, default=10000)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    ap.add_argument("--seconds", type=float, default=3.0)
+    ap.add_argument("--batch", type=int, default=16)
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args(argv)
+
+    symbols = make_symbols(args.symbols)
+    base = None
+    for w in sorted(set(args.workers)):
+        with ShardedMarket(symbols, w, seed=args.seed, interval=None, batch=args.batch) as m:
+            t0, n0 = time.perf_counter(), m.ticks
+            time.sleep(args.seconds)
+            ticks, elapsed = m.ticks - n0, time.perf_counter() - t0
+            t = time.perf_counter()
+            m.snapshot()
+            snap_ms = (time.perf_counter() - t) * 1000
+        rate = ticks / elapsed
+        base = base or rate
+        print(f"{m.workers:3d} workers: {rate:14,.0f} ticks/s  x{rate / base:5.2f}  "
+              f"(snapshot of {len(symbols):,} symbols {snap_ms:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+import argparse
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from candles import CandleStore
+from eventbus import Dom, EventBus, Fill, MarginCall, Tick, Trade
+from matching import MatchingEngine
+from metrics import METRICS
+from orderbook import TICK, OrderBook, to_ticks
+
+SYMBOLS = ["AXION", "BLUEX", "CRYPTOX", "DYNEX", "ECHELON",
+           "FUSION", "HELIX", "INFINEX", "NEXUS", "OMEGA"]
+TIMEFRAMES = [5, 15, 30, 60, 300]
+FIELDS = ('price', 'bid', 'ask', 'volatility', 'trend', 'volume_pressure')
+
+PRESSURE_DECAY = 0.88
+TRADE_PROB = 0.92
+BOOK_LEVELS = 12
+BOOK_STEP = 50  # ticks between maker levels (0.05)
+LIQUIDATION_ROUNDS = 20  # sweeps per position on a margin call, with the makers requoting in between
+# volume_pressure is solved in closed form per chunk; 0.88**-256 still fits comfortably in a float64
+CHUNK = 256
+PRICE_FLOOR = 0.01
+FLOOR_LOG = np.log(PRICE_FLOOR)
+MIN_FACTOR = 1e-12  # a move of -100% or worse still lands on the floor, without a log of zero
+EPOCH = 1700000000.0  # where a seeded session's clock starts, so its bar boundaries repeat run to run
+
+MARGIN_CALLS = METRICS.counter("sim.margin_calls")
+MARKED_OUT = METRICS.counter("sim.marked_out")  # contracts closed at the last price for lack of liquidity
+
+TickBatch = namedtuple("TickBatch", "times idx price bid ask trade side size trade_price")
+
+
+def make_symbols(n):
+    if n <= len(SYMBOLS):
+        return SYMBOLS[:n]
+    return SYMBOLS + [f"SYM{i:05d}" for i in range(len(SYMBOLS), n)]
+
+
+class SymbolState:
+    """dict-style view onto one symbol's row of the simulator arrays"""
+    __slots__ = ('_sim', '_i')
+
+    def __init__(self, sim, i):
+        self._sim = sim
+        self._i = i
+
+    def __getitem__(self, key):
+        if key not in FIELDS: raise KeyError(key)
+        return getattr(self._sim, key)[self._i].item()
+
+    def __setitem__(self, key, value):
+        if key not in FIELDS: raise KeyError(key)
+        getattr(self._sim, key)[self._i] = value
+
+    def keys(self):
+        return FIELDS
+
+    def items(self):
+        return [(k, self[k]) for k in FIELDS]
+
+
+class MarketSimulator:
+    def __init__(self, symbols=None, seed=None, dt=0.135, retention=600, candles=True, clock=None):
+        self.symbols = list(symbols) if symbols is not None else list(SYMBOLS)
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        self.rng = np.random.default_rng(seed)
+        self.dt = dt
+        if clock is None:
+            clock = time.time() if seed is None else EPOCH
+        self.clock = clock
+        self.ticks = 0
+        self.bus = EventBus()
+
+        n = len(self.symbols)
+        rng = self.rng
+        self.price = np.round(rng.uniform(120, 580, n), 2)
+        self.bid = self.price * 0.9991
+        self.ask = self.price * 1.0009
+        self.volatility = rng.choice([0.004, 0.008, 0.012, 0.018, 0.022], n)
+        self.trend = rng.choice([-0.0012, -0.0005, 0, 0.0005, 0.0012], n)
+        self.volume_pressure = np.zeros(n)
+        self.seq = np.zeros(n, dtype=np.int64)
+        self.books = {}
+        self._book_seq = {}
+        self.engine = MatchingEngine()
+        self.portfolio = None
+        # books are shared between the simulator thread and whoever trades or reads depth
+        self.lock = threading.RLock()
+        self.data = {s: SymbolState(self, i) for i, s in enumerate(self.symbols)}
+        self.candles = CandleStore(self.symbols, self.price, TIMEFRAMES, retention) if candles else None
+
+    def get_history(self, sym, tf, n=None):
+        return self.candles.view(sym, tf, n)
+
+    def get_study(self, sym, tf, spec, n=None):
+        return self.candles.study(sym, tf, spec, n)
+
+    def book(self, sym):
+        """The symbol's persistent order book, brought up to the current quote."""
+        with self.lock:
+            b = self.books.get(sym)
+            if b is None:
+                b = self.books[sym] = OrderBook(sym)
+            i = self.index[sym]
+            if self._book_seq.get(sym) != self.seq[i]:
+                self._refresh_book(b, i)
+                self._book_seq[sym] = self.seq[i]
+            return b
+
+    def attach(self, portfolio):
+        """Book the user's fills into portfolio and liquidate it from the simulator thread on a margin call."""
+        with self.lock:
+            self.portfolio = portfolio
+            portfolio.set_prices(self.price)
+
+    def _book_fill(self, sym, side, qty, price):
+        signed = qty if side == 'buy' else -qty
+        self.volume_pressure[self.index[sym]] += (signed / 1000.0) * 0.0055
+        if self.portfolio is not None:
+            self.portfolio.fill(sym, signed, price)
+
+    def _route(self, b, side, qty, price=None, tif='GTC', owner=None):
+        ex = self.engine.submit(b, side, qty, price, tif, owner)
+        fills = []
+        for f in ex.fills:
+            if f.maker_owner == 'user':
+                maker_side = 'sell' if side == 'buy' else 'buy'
+                self._book_fill(b.sym, maker_side, f.qty, f.price)
+                fills.append(Fill(b.sym, maker_side, f.qty, f.price, f.maker_id))
+        if owner == 'user' and ex.filled:
+            self._book_fill(b.sym, side, ex.filled, ex.vwap)
+            fills.append(Fill(b.sym, side, ex.filled, ex.vwap, ex.order_id))
+        if fills:
+            self.bus.publish(fills)
+        return ex
+
+    def submit(self, sym, side, qty, price=None, tif='GTC', owner='user'):
+        """Match an order against the symbol's book; see MatchingEngine.submit."""
+        with self.lock:
+            return self._route(self.book(sym), side, qty, price, tif, owner)
+
+    def liquidate(self):
+        """Close every open position in the attached portfolio at market.
+
+        A position bigger than the book is swept again after the makers
+        requote, up to LIQUIDATION_ROUNDS times; whatever is still open after
+        that is closed at the last price and listed in the MarginCall.
+        """
+        with self.lock:
+            p = self.portfolio
+            equity, used = p.equity, p.used_margin
+            marked = []
+            for sym in p.positions():
+                b, i = self.book(sym), self.index[sym]
+                for _ in range(LIQUIDATION_ROUNDS):
+                    size = p.position(sym)[0]
+                    if not size:
+                        break
+                    self._route(b, 'sell' if size > 0 else 'buy', abs(size), owner='user')
+                    self._refresh_book(b, i)
+                size = p.position(sym)[0]
+                if size:
+                    side, price = 'sell' if size > 0 else 'buy', self.price[i].item()
+                    self._book_fill(sym, side, abs(size), price)
+                    self.bus.publish([Fill(sym, side, abs(size), price, None)])
+                    marked.append((sym, abs(size)))
+                    MARKED_OUT.inc(abs(size))
+            MARGIN_CALLS.inc()
+            self.bus.publish([MarginCall(equity, used, tuple(marked))])
+
+    def cancel(self, sym, oid):
+        with self.lock:
+            return self.book(sym).cancel(oid)
+
+    def cancel_all(self, sym, owner='user'):
+        with self.lock:
+            b = self.book(sym)
+            return [b.cancel(o.id) for o in list(b.orders.values()) if o.owner == owner]
+
+    def _refresh_book(self, b, i):
+        # the simulated market makers quote a 0.05 lattice behind the touch
+        rng = self.rng
+        # near the 0.01 price floor the bid is held at one tick so no quote goes to zero or below
+        bt, at = max(to_ticks(self.bid[i]), 1), to_ticks(self.ask[i])
+        b.pull('buy', bt * TICK, 'mm')
+        b.pull('sell', self.ask[i], 'mm')
+        sizes = rng.integers(80, 1201, 2*BOOK_LEVELS + 2)
+        for side, touch, sign, off in (('buy', bt, -1, 0), ('sell', at, 1, BOOK_LEVELS + 1)):
+            # a little churn so resting depth keeps moving between ticks
+            if b.level_count(side):
+                lvl = list(b.levels(side))[int(rng.integers(min(b.level_count(side), BOOK_LEVELS)))]
+                mm = [o for o in lvl.orders.values() if o.owner == 'mm']
+                if mm and rng.random() < 0.5:
+                    b.cancel(mm[-1].id)
+                else:
+                    b.add(side, lvl.ticks * TICK, int(rng.integers(80, 1201)), 'mm')
+            # new quotes go through the engine so they trade with any resting user order they cross
+            best = b.best(side)
+            if best is None or best.ticks != touch:
+                self._route(b, side, int(sizes[off]), touch * TICK, owner='mm')
+            anchor = touch // BOOK_STEP * BOOK_STEP + (BOOK_STEP if sign > 0 else 0)
+            for j in range(BOOK_LEVELS):
+                px = anchor + sign * j * BOOK_STEP
+                if px > 0 and px != touch and b.level(side, px) is None:
+                    self._route(b, side, int(sizes[off + 1 + j]), px * TICK, owner='mm')
+            b.trim(side, BOOK_LEVELS + 2, 'mm')
+
+    def depth(self, sym, n=15):
+        with self.lock:
+            return self.book(sym).depth(n)
+
+    def _advance(self, idx, n, t0):
+        rng = self.rng
+        k = len(idx)
+        moves = rng.standard_normal((n, k)) * self.volatility[idx] + self.trend[idx]
+        trade = rng.random((n, k)) < TRADE_PROB
+        side = np.where(rng.random((n, k)) < 0.5, 1, -1).astype(np.int8)
+        size = rng.integers(200, 35001, (n, k))
+
+        # pressure[t+1] = 0.88*pressure[t] + impact[t], unrolled as a scaled cumulative sum
+        impact = np.where(trade, size * side * 0.000004, 0.0)
+        decay = PRESSURE_DECAY ** np.arange(n + 1)
+        acc = np.cumsum(impact / decay[1:, None], axis=0)
+        p0 = self.volume_pressure[idx]
+        pressure = np.empty((n, k))
+        pressure[0] = p0
+        pressure[1:] = p0 + acc[:-1]
+        pressure *= decay[:-1, None]
+        self.volume_pressure[idx] = decay[n] * (p0 + acc[-1])
+
+        moves += pressure * 0.8
+        # price[t] = max(0.01, price[t-1] * (1 + move[t])): in logs a walk held at the floor, which is
+        # the free walk lifted by the furthest it has dipped below the floor so far
+        steps = np.log(np.maximum(1 + moves, MIN_FACTOR))
+        walk = np.cumsum(steps, axis=0)
+        walk += np.log(self.price[idx])
+        walk += np.maximum(np.maximum.accumulate(FLOOR_LOG - walk, axis=0), 0.0)
+        price = np.exp(walk)
+        np.maximum(price, PRICE_FLOOR, out=price)
+        half = np.maximum(0.05, np.abs(moves)*50 + rng.uniform(0.03, 0.35, (n, k))) / 2
+        bid = np.maximum(price - half, TICK)
+        ask = price + half
+        trade_price = price + rng.uniform(-0.4, 0.4, (n, k))
+
+        self.price[idx] = np.round(price[-1], 3)
+        self.bid[idx] = np.round(bid[-1], 3)
+        self.ask[idx] = np.round(ask[-1], 3)
+        self.seq[idx] += n
+        times = t0 + self.dt * np.arange(1, n + 1)
+        return TickBatch(times, idx, price, bid, ask, trade, side, size, trade_price)
+
+    def step(self, n=1, idx=None, now=None):
+        """Advance the symbols in idx (default: all) by n steps and return the ticks as a TickBatch.
+
+        With now set the whole batch is stamped at that wall-clock time, otherwise
+        the simulated clock moves forward by dt per step.
+        """
+        idx = np.arange(len(self.symbols)) if idx is None else np.asarray(idx)
+        parts = []
+        for start in range(0, n, CHUNK):
+            m = min(CHUNK, n - start)
+            part = self._advance(idx, m, self.clock)
+            if now is None:
+                self.clock = part.times[-1]
+            else:
+                part.times[:] = now
+            self._post(part)
+            parts.append(part)
+        self.ticks += n * len(idx)
+        if len(parts) == 1:
+            return parts[0]
+        return TickBatch(np.concatenate([p.times for p in parts]), idx,
+                         *(np.concatenate([getattr(p, f) for p in parts]) for f in TickBatch._fields[2:]))
+
+    def _post(self, batch, liquidate=True):
+        if self.candles is not None:
+            self.candles.ingest(batch)
+        if self.portfolio is not None:
+            with self.lock:
+                self.portfolio.mark_many(batch.idx, self.price[batch.idx])
+                if liquidate and self.portfolio.breached():
+                    self.liquidate()
+
+    def apply(self, batch, liquidate=True):
+        """Take an externally produced TickBatch (e.g. a replayed recording) as the next ticks."""
+        idx = batch.idx
+        self.price[idx] = np.round(batch.price[-1], 3)
+        self.bid[idx] = np.round(batch.bid[-1], 3)
+        self.ask[idx] = np.round(batch.ask[-1], 3)
+        self.seq[idx] += len(batch.times)
+        self.clock = float(batch.times[-1])
+        self._post(batch, liquidate)
+        self.ticks += batch.price.size
+
+    def reset_prices(self, price, bid, ask, clock=None):
+        """Restart the market from the given quotes; candles start over, positions are re-marked."""
+        with self.lock:
+            self.price[:] = price
+            self.bid[:] = bid
+            self.ask[:] = ask
+            self.volume_pressure[:] = 0
+            self.seq += 1
+            if clock is not None:
+                self.clock = clock
+            if self.candles is not None:
+                old = self.candles
+                self.candles = CandleStore(self.symbols, self.price, old.timeframes, old.frames[old.base].capacity)
+                for tf, spec in old.studies:
+                    self.candles.add(tf, spec)
+            if self.portfolio is not None:
+                self.portfolio.set_prices(self.price)
+
+    def publish_batch(self, batch):
+        """Publish a batch as Trade events for every print, then the latest Tick and a Dom per symbol."""
+        events = []
+        rows, cols = np.nonzero(batch.trade)
+        for r, c in zip(rows.tolist(), cols.tolist()):
+            events.append(Trade(self.symbols[batch.idx[c]], 'buy' if batch.side[r, c] > 0 else 'sell',
+                                int(batch.size[r, c]), round(float(batch.trade_price[r, c]), 3),
+                                datetime.fromtimestamp(batch.times[r]).strftime("%H:%M:%S.%f")[:12]))
+        t = float(batch.times[-1])
+        for i in batch.idx.tolist():
+            sym = self.symbols[i]
+            if sym in self.books:
+                self.book(sym)
+            events.append(Tick(sym, self.price[i].item(), self.bid[i].item(), self.ask[i].item(), t))
+            events.append(Dom(sym))
+        self.bus.publish(events)
+
+    def run(self, steps=None):
+        """Wall-clock mode: one random symbol every 70-200 ms, one event batch per step on self.bus."""
+        step_span, publish_span = METRICS.span("sim.step"), METRICS.span("sim.publish")
+        n = 0
+        while steps is None or n < steps:
+            # the first tick goes out immediately; the pause comes after each step
+            if n:
+                time.sleep(0.07 + self.rng.random()*0.13)
+            i = int(self.rng.integers(len(self.symbols)))
+            with step_span:
+                batch = self.step(1, idx=[i], now=time.time())
+            with publish_span:
+                self.publish_batch(batch)
+            n += 1
+
+    def run_fast(self, steps, batch=CHUNK, on_batch=None):
+        """As-fast-as-possible mode: every symbol advances on every step, in batches of `batch` steps."""
+        done = 0
+        while done < steps:
+            m = min(batch, steps - done)
+            b = self.step(m)
+            if on_batch is not None:
+                on_batch(b)
+            done += m
+        return done * len(self.symbols)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Headless market simulator")
+    ap.add_argument("--symbols", type=int, default=len(SYMBOLS))
+    ap.add_argument("--steps", type=int, default=100000)
+    ap.add_argument("--batch", type=int, default=CHUNK)
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--retention", type=int, default=600, help="bars kept per symbol and timeframe")
+    ap.add_argument("--no-candles", action="store_true")
+    ap.add_argument("--realtime", action="store_true", help="wall-clock mode instead of max speed")
+    args = ap.parse_args(argv)
+
+    sim = MarketSimulator(make_symbols(args.symbols), seed=args.seed,
+                          retention=args.retention, candles=not args.no_candles)
+    t0 = time.perf_counter()
+    if args.realtime:
+        sim.run(args.steps)
+        ticks = sim.ticks
+    else:
+        ticks = sim.run_fast(args.steps, args.batch)
+    elapsed = time.perf_counter() - t0
+    print(f"{ticks:,} ticks over {len(sim.symbols)} symbols in {elapsed:.3f}s "
+          f"({ticks / elapsed:,.0f} ticks/s)")
+
+
+if __name__ == "__main__":
+    main()